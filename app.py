@@ -1,11 +1,51 @@
 # app.py
 import os
+import atexit
 import json
+import threading
 import time
-import requests
-from flask import Flask, request, jsonify
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import click
+from flask import Flask, Response, abort, request, jsonify
 from dotenv import load_dotenv
 
+from catalog import Catalog
+from conversation import ANY, UNKNOWN, FlowTable, normalize, reply_id, search_query
+from dedup import MessageDeduplicator
+from inventory import open_inventory
+from ledger import OrderLedger
+from metrics import BYTE_BUCKETS, REGISTRY
+from n8n_export import OrderExporter, OrderOutbox, build_order
+from outbound import OutboundDispatcher, coalesce
+from profiler import SamplingProfiler
+from rendering import (
+    INTERACTIVE_BODY_LIMIT,
+    LIST_PAGE_SIZE,
+    MAIN_MENU_LIST,
+    MAIN_MENU_TEXT,
+    MAX_LIST_ROWS,
+    UNKNOWN_PRODUCT,
+    CatalogRenderer,
+    button_message,
+    cart_summary_text,
+    cart_totals,
+    modify_cart_list,
+    modify_cart_text,
+    search_results_list,
+    search_results_text,
+)
+from search import ProductSearch
+from session_store import (
+    CachedSessionStore,
+    RedisSessionStore,
+    encode_session,
+    migrate_json_sessions,
+    open_session_store,
+)
+from sweeper import CartArchive, SessionSweeper
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -19,116 +59,226 @@ app = Flask(__name__)
 DATA_FILE = "user_data.json"
 SESSION_TIMEOUT_SECONDS = 5 * 60  # 5 minutes
 
-
-N8N_WEBHOOK_URL = "https://n8n.my8n.xyz/webhook-test/whatsapp-order"
-
-def export_to_n8n(phone, cart, stage="Completed"):
-    total = sum(PRODUCTS[pid]["price"] * qty for pid, qty in cart.items())
-    for pid, qty in cart.items():
-        product = PRODUCTS.get(pid, {})
-        payload = {
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "phone": phone,
-            "product_name": product.get("name", "Unknown"),
-            "quantity": qty,
-            "price": product.get("price", 0),
-            "total_item": product.get("price", 0) * qty,
-            "grand_total": total,
-            "stage": stage,
-        }
-        try:
-            r = requests.post(N8N_WEBHOOK_URL, json=payload, timeout=10)
-            if r.status_code == 200:
-                print(f"Sent order for {phone} → {product['name']} to n8n.")
-            else:
-                print(f"n8n responded with {r.status_code}: {r.text}")
-        except Exception as e:
-            print(f"Failed to send order data to n8n: {e}")
+# -------------------- Metrics --------------------
+# Rendered on GET /metrics; gauges over live state are registered further down.
+WEBHOOK_SECONDS = REGISTRY.histogram("webhook_request_seconds", "Time to handle one POST /webhook.")
+MESSAGE_SECONDS = REGISTRY.histogram(
+    "message_handling_seconds", "Time to handle one message, by stage it arrived in.", labels=("stage",)
+)
+MESSAGES = REGISTRY.counter("messages_total", "Incoming messages by outcome.", labels=("outcome",))
+CHECKOUTS = REGISTRY.counter("checkouts_total", "Confirmed checkouts.")
+SESSION_SAVE_SECONDS = REGISTRY.histogram("session_save_seconds", "Time to encode and write one session.")
+SESSION_SAVE_BYTES = REGISTRY.histogram(
+    "session_save_bytes", "Encoded size of saved sessions.", buckets=BYTE_BUCKETS
+)
+
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "https://n8n.my8n.xyz/webhook-test/whatsapp-order")
+N8N_OUTBOX_PATH = os.getenv("N8N_OUTBOX_PATH", "n8n_outbox.db")
+
+n8n_exporter = OrderExporter(
+    N8N_WEBHOOK_URL,
+    OrderOutbox(N8N_OUTBOX_PATH),
+    concurrency=int(os.getenv("N8N_EXPORT_CONCURRENCY", "2")),
+    batch_size=int(os.getenv("N8N_EXPORT_BATCH_SIZE", "1")),
+    batch_wait=float(os.getenv("N8N_EXPORT_BATCH_WAIT", "0")),
+)
+atexit.register(n8n_exporter.shutdown)
+
+# Local append-only order history, with prices as charged; see ledger.py.
+# One file per host: with several hosts, history and reorder only see the
+# orders confirmed on this one.
+order_ledger = OrderLedger(os.getenv("ORDER_LEDGER_PATH", "orders.db"))
+
+# Stock is held while it sits in a cart and sold on confirm; products never
+# given stock (see inventory.py) are unlimited. Holds lapse after
+# RESERVATION_SECONDS without activity and are re-checked at checkout.
+INVENTORY_URL = os.getenv("INVENTORY_URL", "sqlite:///inventory.db")
+RESERVATION_SECONDS = int(os.getenv("RESERVATION_SECONDS", str(15 * 60)))
+# SQLite files the stock is split over, so carts for different products don't
+# share a write lock. Fixed once the files exist.
+INVENTORY_SHARDS = int(os.getenv("INVENTORY_SHARDS", "8"))
+inventory = open_inventory(INVENTORY_URL, hold_seconds=RESERVATION_SECONDS, shards=INVENTORY_SHARDS)
+# Largest quantity of one product per cart line.
+MAX_LINE_QUANTITY = int(os.getenv("MAX_LINE_QUANTITY", "999"))
+
+def export_to_n8n(phone, cart, stage="Completed", order_id=None):
+    # Persisted to the outbox first; delivery happens on the exporter's workers.
+    return n8n_exporter.export(build_order(phone, cart, PRODUCTS, stage, order_id))
+
+def pending_order_id(user):
+    # Kept in the session until the order completes: a confirm that is
+    # redelivered or repeated after a failure reuses it, and the inventory,
+    # outbox and ledger all ignore an order id they have already taken.
+    return user.setdefault("order_id", uuid.uuid4().hex)
 
 
 # -------------------- Persistent user data --------------------
-def load_user_data():
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r") as f:
-                content = f.read().strip()
-                if not content:
-                    return {}
-                return json.loads(content)
-        except json.JSONDecodeError:
-            print("⚠️ user_data.json corrupted or empty, resetting.")
-            return {}
-    return {}
-
-def save_user_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-user_sessions = load_user_data()
+# sqlite:///path shares sessions between workers on one host; redis://host:port/db
+# shares them between hosts.
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "sqlite:///sessions.db")
+# Hot sessions kept in memory; 0 disables the cache (needed when several
+# worker processes write to the same store). Always off with Redis, whose
+# sessions are shared with other hosts.
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_EXPIRY_SECONDS = int(os.getenv("SESSION_EXPIRY_SECONDS", str(7 * 24 * 3600)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+CART_ARCHIVE_PATH = os.getenv("CART_ARCHIVE_PATH", "abandoned_carts.db")
+
+session_backend = open_session_store(SESSION_STORE_URL)
+migrate_json_sessions(DATA_FILE, session_backend)
+user_sessions = session_backend
+if SESSION_CACHE_SIZE > 0 and not isinstance(session_backend, RedisSessionStore):
+    user_sessions = CachedSessionStore(session_backend, max_size=SESSION_CACHE_SIZE)
+
+def save_user_session(phone, user):
+    started = time.perf_counter()
+    data = encode_session(user)
+    user_sessions.put_raw(phone, data)
+    SESSION_SAVE_SECONDS.observe(time.perf_counter() - started)
+    SESSION_SAVE_BYTES.observe(len(data))
+
+# -------------------- Webhook deduplication --------------------
+# Meta redelivers webhooks it thinks timed out; each message id is handled once.
+# With the Redis store, ids are claimed in Redis so every host sees them.
+dedup = MessageDeduplicator(
+    max_size=int(os.getenv("DEDUP_MAX_SIZE", "100000")),
+    ttl=int(os.getenv("DEDUP_TTL_SECONDS", str(24 * 3600))),
+    path=None if isinstance(session_backend, RedisSessionStore) else os.getenv("DEDUP_DB_PATH") or None,
+    claim=session_backend.claim if isinstance(session_backend, RedisSessionStore) else None,
+    unclaim=session_backend.unclaim if isinstance(session_backend, RedisSessionStore) else None,
+)
+dedup.purge()
+
+# -------------------- Session expiry --------------------
+session_sweeper = SessionSweeper(
+    user_sessions,
+    CartArchive(CART_ARCHIVE_PATH),
+    idle_seconds=SESSION_EXPIRY_SECONDS,
+    interval=SESSION_SWEEP_INTERVAL,
+    tasks=[dedup.purge, inventory.release_expired],
+    on_expire=[inventory.release_all],
+).start()
 
 # -------------------- Product Catalog --------------------
-PRODUCTS = {
-    "1": {"name": "Wireless Mouse", "price": 650},
-    "2": {"name": "Bluetooth Headphones", "price": 799},
-    "3": {"name": "USB-C Charger", "price": 1499},
-    "4": {"name": "Laptop Stand", "price": 699},
-}
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.jsonl"))
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "10"))
+# Buttons and lists instead of "reply with..." texts; set to 0 for plain text.
+INTERACTIVE_MESSAGES = os.getenv("INTERACTIVE_MESSAGES", "1") != "0"
+# A list message holds at most 10 rows, two of which are prev/next.
+PAGE_SIZE = min(CATALOG_PAGE_SIZE, LIST_PAGE_SIZE) if INTERACTIVE_MESSAGES else CATALOG_PAGE_SIZE
+
+PRODUCTS = Catalog(CATALOG_PATH, reload_interval=float(os.getenv("CATALOG_RELOAD_INTERVAL", "5")))
+
+def refresh_catalog():
+    # Cheap stat() at most every reload_interval; picks up catalog edits without a restart.
+    try:
+        if PRODUCTS.reload_if_changed():
+            catalog_renderer.set_catalog(PRODUCTS, PRODUCTS.version)
+            product_search.refresh()
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Catalog reload failed, keeping version {PRODUCTS.version}: {e}")
 
 # -------------------- WhatsApp send helper --------------------
-def send_whatsapp_message(phone_number, message):
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
-    headers = {
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com")
+
+outbound = OutboundDispatcher(
+    f"{GRAPH_API_URL}/{VERSION}/{PHONE_NUMBER_ID}/messages",
+    headers={
         "Authorization": f"Bearer {ACCESS_TOKEN}",
         "Content-Type": "application/json",
-    }
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": phone_number,
-        "type": "text",
-        "text": {"body": message},
-    }
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=10)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Failed to send message: {e}")
-        if "resp" in locals():
-            print("Response:", resp.text)
+    },
+    workers=int(os.getenv("OUTBOUND_WORKERS", "8")),
+)
+atexit.register(outbound.shutdown)
 
-# -------------------- Menu / text blocks --------------------
-def main_menu_text():
-    return (
-        "*🛍️ Welcome to ShopEase!* 👋\n\n"
-        "Choose an option:\n\n"
-        "1️⃣ *Browse Our Collection*\n"
-        "2️⃣ *View Cart*\n"
-        "3️⃣ *Edit Cart*\n"
-        "4️⃣ *Proceed to Checkout*\n"
-        "5️⃣ *Customer Support*\n"
-        "6️⃣ *Help / Main Menu*\n\n"
-        "Reply with the number or option name.\n(Type *menu* anytime to return here.)"
-    )
+_replies = threading.local()
 
-def show_products_text():
-    msg = "*🛒 Available Products:*\n\n"
-    for pid, p in PRODUCTS.items():
-        msg += f"{pid}. {p['name']} — ₹{p['price']}\n"
-    msg += "\nReply with the *product number* to add it to your cart, or type *menu* to go back."
-    return msg
+def send_whatsapp_message(phone_number, message):
+    # ``message`` is a text or an interactive object (see rendering.py).
+    # Inside buffered_replies() it is held back and coalesced; otherwise it
+    # is queued and the dispatcher talks to the Graph API.
+    if getattr(_replies, "phone", None) == phone_number:
+        _replies.texts.append(message)
+        return
+    payload = {"messaging_product": "whatsapp", "to": phone_number}
+    if isinstance(message, dict):
+        payload.update(type="interactive", interactive=message)
+    else:
+        payload.update(type="text", text={"body": message})
+    outbound.submit(phone_number, payload)
+
+def send_choices(phone_number, text, buttons):
+    """``text`` with reply buttons, or just the text when interactive messages are off."""
+    if not INTERACTIVE_MESSAGES:
+        send_whatsapp_message(phone_number, text)
+    elif len(text) > INTERACTIVE_BODY_LIMIT:
+        send_whatsapp_message(phone_number, text)
+        send_whatsapp_message(phone_number, button_message("Choose an option:", buttons))
+    else:
+        send_whatsapp_message(phone_number, button_message(text, buttons))
+
+@contextmanager
+def buffered_replies(phone_number):
+    """Collect what a handler sends to ``phone_number`` and send it as few messages as fit."""
+    _replies.phone, _replies.texts = phone_number, []
+    try:
+        yield
+    except BaseException:
+        # The session wasn't saved and the message will be handled again on
+        # redelivery, so half its replies would only be sent twice.
+        _replies.phone = _replies.texts = None
+        raise
+    texts = _replies.texts
+    _replies.phone = _replies.texts = None
+    for body in coalesce(texts):
+        send_whatsapp_message(phone_number, body)
+
+def flush_outbound(timeout=None):
+    return outbound.flush(timeout)
 
-def cart_summary_text(cart):
-    if not cart:
-        return "🛒 Your cart is empty.\n\nType *1* to browse products or *menu* to see options."
-    msg = "*🧺 Your Cart:*\n"
-    total = 0
-    count = 0
-    for pid, qty in cart.items():
-        p = PRODUCTS.get(pid, {"name": "Unknown", "price": 0})
-        msg += f"- {p['name']} × {qty} = ₹{p['price'] * qty}\n"
-        total += p["price"] * qty
-        count += qty
-    msg += f"\n*Items:* {count}\n*Total:* ₹{total}\n\nReply *checkout* to pay, *edit* to modify, or *menu* to return."
-    return msg
+# -------------------- Menu / text blocks --------------------
+catalog_renderer = CatalogRenderer(PRODUCTS, PRODUCTS.version)
+product_search = ProductSearch(PRODUCTS)
+threading.Thread(target=product_search.warm, name="search-warmup", daemon=True).start()
+
+def main_menu():
+    return MAIN_MENU_LIST if INTERACTIVE_MESSAGES else MAIN_MENU_TEXT
+
+def show_catalog_page(turn, page):
+    page = min(max(page, 0), PRODUCTS.page_count(PAGE_SIZE) - 1)
+    turn.user["catalog_page"] = page
+    if INTERACTIVE_MESSAGES:
+        send_whatsapp_message(turn.phone, catalog_renderer.catalog_list(page, PAGE_SIZE))
+    else:
+        send_whatsapp_message(turn.phone, catalog_renderer.catalog_page(page, PAGE_SIZE))
+
+def show_search_results(turn, query, results):
+    if INTERACTIVE_MESSAGES and results:
+        send_whatsapp_message(turn.phone, search_results_list(query, results, PRODUCTS))
+    else:
+        send_whatsapp_message(turn.phone, search_results_text(query, results, PRODUCTS))
+
+# Reply buttons, by the step they are offered in.
+QUANTITY_BUTTONS = [(reply_id("awaiting_quantity", "quantity", n), n) for n in ("1", "2", "3")]
+POST_ADD_BUTTONS = [
+    (reply_id("post_add_choice", "browse"), "Continue shopping"),
+    (reply_id(ANY, "view_cart"), "View cart"),
+    (reply_id(ANY, "checkout"), "Checkout"),
+]
+CART_BUTTONS = [
+    (reply_id("cart_view", "checkout"), "Checkout"),
+    (reply_id(ANY, "edit_cart"), "Edit cart"),
+    (reply_id(ANY, "menu"), "Main menu"),
+]
+CONFIRM_BUTTONS = [
+    (reply_id("awaiting_checkout_confirm", "confirm"), "Confirm"),
+    (reply_id("awaiting_checkout_confirm", "cancel"), "Cancel"),
+]
+POST_CHECKOUT_BUTTONS = [
+    (reply_id("post_checkout_choice", "browse"), "Continue shopping"),
+    (reply_id("post_checkout_choice", "exit"), "Exit"),
+]
+UPDATE_BUTTONS = [(reply_id("awaiting_update", "quantity", "0"), "Remove item")]
 
 # -------------------- Webhook verification --------------------
 @app.route("/webhook", methods=["GET"])
@@ -143,322 +293,502 @@ def verify_webhook():
             return "Verification failed", 403
     return "No content", 404
 
+# -------------------- Conversation handlers --------------------
+flow = FlowTable()
+
+@flow.on(ANY, "greet", to="menu")
+def greet(turn):
+    send_whatsapp_message(turn.phone, "👋 Hi there! Here's what I can do for you:")
+    send_whatsapp_message(turn.phone, main_menu())
+    turn.user["stage"] = "menu"
+
+@flow.on(ANY, "browse", to="browsing")
+def browse(turn):
+    show_catalog_page(turn, 0)
+    turn.user["stage"] = "browsing"
+
+@flow.on(ANY, "menu", to="menu")
+def show_menu(turn):
+    send_whatsapp_message(turn.phone, main_menu())
+    turn.user["stage"] = "menu"
+
+@flow.on(ANY, "view_cart", to="cart_view")
+def view_cart(turn):
+    if turn.cart:
+        send_choices(turn.phone, cart_summary_text(turn.cart, PRODUCTS), CART_BUTTONS)
+    else:
+        send_whatsapp_message(turn.phone, cart_summary_text(turn.cart, PRODUCTS))
+    turn.user["stage"] = "cart_view"
+
+@flow.on(ANY, "edit_cart", to=["menu", "modifying"])
+def edit_cart(turn):
+    if not turn.cart:
+        send_whatsapp_message(
+            turn.phone, "🛒 Your cart is empty — nothing to modify.\nType *1* to browse products."
+        )
+        turn.user["stage"] = "menu"
+    else:
+        if INTERACTIVE_MESSAGES and len(turn.cart) <= MAX_LIST_ROWS:
+            send_whatsapp_message(turn.phone, modify_cart_list(turn.cart, PRODUCTS))
+        else:
+            send_whatsapp_message(turn.phone, modify_cart_text(turn.cart, PRODUCTS))
+        turn.user["stage"] = "modifying"
+
+@flow.on(ANY, "checkout", to=["menu", "awaiting_checkout_confirm"])
+def checkout(turn):
+    if not turn.cart:
+        send_whatsapp_message(turn.phone, "🛒 Your cart is empty — add items before checkout.")
+        send_whatsapp_message(turn.phone, main_menu())
+        turn.user["stage"] = "menu"
+    else:
+        _, total = cart_totals(turn.cart, PRODUCTS)
+        send_choices(
+            turn.phone,
+            f"💳 Your total is ₹{total}. Reply *confirm* to complete purchase or *cancel* to return.",
+            CONFIRM_BUTTONS,
+        )
+        pending_order_id(turn.user)
+        turn.user["stage"] = "awaiting_checkout_confirm"
+
+@flow.on(ANY, "support", to="menu")
+def customer_support(turn):
+    send_whatsapp_message(
+        turn.phone,
+        "📞 Customer Support:\nCall: +91-9876543210\nEmail: support@shopease.com\n\nWe are available 9:00–18:00 IST.",
+    )
+    send_whatsapp_message(turn.phone, "Anything else? Here's the main menu:")
+    send_whatsapp_message(turn.phone, main_menu())
+    turn.user["stage"] = "menu"
+
+@flow.on(ANY, "reorder", to=["menu", "cart_view"])
+def reorder(turn):
+    last = order_ledger.last_order(turn.phone)
+    if last is None:
+        send_whatsapp_message(turn.phone, "You don't have any previous orders yet.")
+        send_whatsapp_message(turn.phone, main_menu())
+        turn.user["stage"] = "menu"
+        return
+    # The last order replaces the cart; items no longer sold or out of stock
+    # are left out, and short items are cut to what is left.
+    inventory.release_all(turn.phone)
+    cart, notes = {}, []
+    for item in last["items"]:
+        pid, qty = item["product_id"], item["quantity"]
+        product = PRODUCTS.get(pid)
+        if product is None:
+            notes.append(f"- {item['product_name']} is no longer available")
+            continue
+        if not inventory.reserve(turn.phone, pid, qty):
+            left = inventory.available(pid) or 0
+            if not left or not inventory.reserve(turn.phone, pid, left):
+                notes.append(f"- {product['name']} is out of stock")
+                continue
+            notes.append(f"- only {left} × {product['name']} left (you ordered {qty})")
+            qty = left
+        cart[pid] = cart.get(pid, 0) + qty
+        if product["price"] != item["price"]:
+            notes.append(f"- {product['name']} is now ₹{product['price']} (was ₹{item['price']})")
+    if not cart:
+        # Keep the cart as it was, holds included.
+        for pid, qty in turn.cart.items():
+            inventory.reserve(turn.phone, pid, qty)
+        send_whatsapp_message(turn.phone, "😕 None of the items from your last order are available right now.")
+        send_whatsapp_message(turn.phone, main_menu())
+        turn.user["stage"] = "menu"
+        return
+    turn.user["cart"] = cart
+    send_whatsapp_message(turn.phone, f"🔁 Your cart now has the items from your order of {last['day']}.")
+    if notes:
+        send_whatsapp_message(turn.phone, "Since then:\n" + "\n".join(notes))
+    send_choices(turn.phone, cart_summary_text(cart, PRODUCTS), CART_BUTTONS)
+    turn.user["stage"] = "cart_view"
+
+@flow.on(ANY, "search", to="browsing")
+def search_products(turn):
+    query = search_query(turn.text)
+    results = product_search.search(query, limit=PAGE_SIZE) if query else []
+    show_search_results(turn, query, results)
+    turn.user["stage"] = "browsing"
+
+@flow.on("menu", UNKNOWN, to=["menu", "browsing"])
+def search_or_fallback(turn):
+    # Free text on the menu is treated as a product search before giving up.
+    results = product_search.search(turn.text, limit=PAGE_SIZE)
+    if results:
+        show_search_results(turn, turn.text, results)
+        turn.user["stage"] = "browsing"
+    else:
+        fallback(turn)
+
+@flow.on(ANY, UNKNOWN, to="menu")
+def fallback(turn):
+    send_whatsapp_message(turn.phone, "😕 I didn't understand that. Here's the main menu to guide you:")
+    send_whatsapp_message(turn.phone, main_menu())
+    turn.user["stage"] = "menu"
+
+# Browsing
+@flow.on("browsing", "product", to=["browsing", "awaiting_quantity"])
+def select_product(turn):
+    if turn.text in PRODUCTS:
+        turn.user["selected_product"] = turn.text
+        turn.user["stage"] = "awaiting_quantity"
+        send_choices(
+            turn.phone,
+            f"How many *{PRODUCTS[turn.text]['name']}* would you like to add? (enter a number)",
+            QUANTITY_BUTTONS,
+        )
+    else:
+        browsing_reprompt(turn)
+
+@flow.on("browsing", "next_page", to="browsing")
+def next_page(turn):
+    show_catalog_page(turn, turn.user.get("catalog_page", 0) + 1)
+
+@flow.on("browsing", "prev_page", to="browsing")
+def prev_page(turn):
+    show_catalog_page(turn, turn.user.get("catalog_page", 0) - 1)
+
+@flow.on("browsing", UNKNOWN, to="browsing")
+def browsing_reprompt(turn):
+    results = product_search.search(turn.text, limit=PAGE_SIZE) if turn.intent == UNKNOWN else []
+    if results:
+        show_search_results(turn, turn.text, results)
+        return
+    send_whatsapp_message(turn.phone, "Reply with a *product number* to add it, or *menu* to return.")
+
+# Awaiting quantity
+@flow.on("awaiting_quantity", "quantity", to=["awaiting_quantity", "browsing", "post_add_choice"])
+def add_to_cart(turn):
+    qty = int(turn.text)
+    pid = turn.user.get("selected_product")
+    if qty <= 0 or qty + turn.cart.get(pid, 0) > MAX_LINE_QUANTITY:
+        quantity_reprompt(turn)
+        return
+    if pid and pid in PRODUCTS:
+        if not inventory.reserve(turn.phone, pid, qty):
+            left = inventory.available(pid) or 0
+            if left:
+                send_whatsapp_message(
+                    turn.phone, f"😕 Only {left} × *{PRODUCTS[pid]['name']}* left. Please enter a smaller quantity."
+                )
+            else:
+                send_whatsapp_message(turn.phone, f"😕 *{PRODUCTS[pid]['name']}* is out of stock.")
+                show_catalog_page(turn, turn.user.get("catalog_page", 0))
+                turn.user["stage"] = "browsing"
+            return
+        turn.cart[pid] = turn.cart.get(pid, 0) + qty
+        send_whatsapp_message(
+            turn.phone,
+            f"✅ You have added *{qty} × {PRODUCTS[pid]['name']}* to your cart.",
+        )
+        send_choices(turn.phone, "Would you like to *continue shopping* or go to the *menu*?", POST_ADD_BUTTONS)
+        turn.user["stage"] = "post_add_choice"
+    else:
+        send_whatsapp_message(
+            turn.phone, "❌ That product doesn't exist. Please reply with a valid product number."
+        )
+
+@flow.on("awaiting_quantity", UNKNOWN, to="awaiting_quantity")
+def quantity_reprompt(turn):
+    send_whatsapp_message(
+        turn.phone, f"❌ Please enter a valid quantity (a positive number up to {MAX_LINE_QUANTITY})."
+    )
+
+@flow.on("post_add_choice", UNKNOWN, to="post_add_choice")
+def post_add_reprompt(turn):
+    send_choices(
+        turn.phone, "Reply *continue* to keep shopping or *menu* to return to main menu.", POST_ADD_BUTTONS
+    )
+
+# Cart view
+@flow.on("cart_view", "checkout", to=["browsing", "awaiting_checkout_confirm"])
+def checkout_from_cart(turn):
+    if not turn.cart:
+        send_whatsapp_message(turn.phone, "🛒 Your cart is empty. Browse products to add items first.")
+        show_catalog_page(turn, 0)
+        turn.user["stage"] = "browsing"
+    else:
+        _, total = cart_totals(turn.cart, PRODUCTS)
+        send_choices(
+            turn.phone,
+            f"💳 Your total is ₹{total}.\nReply *confirm* to complete purchase, or *cancel* to go back.",
+            CONFIRM_BUTTONS,
+        )
+        pending_order_id(turn.user)
+        turn.user["stage"] = "awaiting_checkout_confirm"
+
+@flow.on("cart_view", UNKNOWN, to="cart_view")
+def cart_view_reprompt(turn):
+    send_choices(
+        turn.phone,
+        "Please reply with *1* to browse, *edit* to modify, *checkout* to pay, or *menu* to return.",
+        CART_BUTTONS,
+    )
+
+# Checkout confirmation
+@flow.on("awaiting_checkout_confirm", "confirm", to=["cart_view", "post_checkout_choice"])
+def confirm_checkout(turn):
+    order_id = pending_order_id(turn.user)
+    shortages = inventory.commit(turn.phone, turn.cart, order_id)
+    if shortages:
+        # Nothing was sold; cut the cart to what is left and let them decide.
+        lines = []
+        for pid, left in shortages:
+            name = PRODUCTS.get(pid, UNKNOWN_PRODUCT)["name"]
+            if left:
+                turn.cart[pid] = left
+                lines.append(f"- only {left} × *{name}* left")
+            else:
+                del turn.cart[pid]
+                lines.append(f"- *{name}* is out of stock")
+        send_whatsapp_message(
+            turn.phone, "😕 Some items sold out before checkout, so your cart was updated:\n" + "\n".join(lines)
+        )
+        view_cart(turn)
+        return
+    order = export_to_n8n(turn.phone, turn.cart, stage="Completed", order_id=order_id)
+    order_ledger.record(order)
+    CHECKOUTS.inc()
+    send_whatsapp_message(
+        turn.phone,
+        f"✅ Checkout complete! Your card was charged ₹{order['grand_total']}.\nThank you for shopping with ShopEase! 🛍️",
+    )
+    turn.user["cart"] = {}
+    del turn.user["order_id"]
+    turn.user["stage"] = "post_checkout_choice"
+    send_choices(turn.phone, "Would you like to *continue shopping* or *exit*?", POST_CHECKOUT_BUTTONS)
+
+@flow.on("awaiting_checkout_confirm", "cancel", to="menu")
+def cancel_checkout(turn):
+    send_whatsapp_message(turn.phone, "Checkout canceled. Returning to main menu.")
+    send_whatsapp_message(turn.phone, main_menu())
+    turn.user["stage"] = "menu"
+
+@flow.on("awaiting_checkout_confirm", UNKNOWN, to="awaiting_checkout_confirm")
+def checkout_reprompt(turn):
+    send_choices(turn.phone, "Reply *confirm* to complete purchase or *cancel* to return.", CONFIRM_BUTTONS)
+
+@flow.on("post_checkout_choice", "exit", to="menu")
+def finish(turn):
+    send_whatsapp_message(
+        turn.phone,
+        "Thanks for visiting ShopEase! If you need anything else, type *hi* or *menu* anytime.",
+    )
+    turn.user["stage"] = "menu"
+
+@flow.on("post_checkout_choice", UNKNOWN, to="post_checkout_choice")
+def post_checkout_reprompt(turn):
+    send_choices(turn.phone, "Please reply *continue* to shop more or *exit* to finish.", POST_CHECKOUT_BUTTONS)
+
+# Edit / modify cart
+@flow.on("modifying", ["cart_item", UNKNOWN], to=["modifying", "awaiting_update"])
+def select_cart_item(turn):
+    if turn.text in turn.cart:
+        turn.user["selected_product"] = turn.text
+        turn.user["stage"] = "awaiting_update"
+        send_choices(
+            turn.phone,
+            f"Enter the new quantity for *{PRODUCTS.get(turn.text, UNKNOWN_PRODUCT)['name']}* (0 to remove):",
+            UPDATE_BUTTONS,
+        )
+    else:
+        send_whatsapp_message(
+            turn.phone, "Reply with the product number in your cart, or *menu* to return."
+        )
+
+@flow.on("awaiting_update", "quantity", to=["awaiting_update", "menu"])
+def update_quantity(turn):
+    qty = int(turn.text)
+    if qty > MAX_LINE_QUANTITY:
+        update_reprompt(turn)
+        return
+    pid = turn.user.get("selected_product")
+    if pid and pid in turn.cart:
+        change = qty - turn.cart[pid]
+        if change > 0 and not inventory.reserve(turn.phone, pid, change):
+            left = turn.cart[pid] + (inventory.available(pid) or 0)
+            send_whatsapp_message(turn.phone, f"😕 Only {left} available. Please enter a smaller quantity.")
+            return
+        if change < 0:
+            inventory.release(turn.phone, pid, -change)
+        if qty == 0:
+            del turn.cart[pid]
+            send_whatsapp_message(turn.phone, f"🗑️ Removed *{PRODUCTS.get(pid, UNKNOWN_PRODUCT)['name']}* from your cart.")
+        else:
+            turn.cart[pid] = qty
+            send_whatsapp_message(turn.phone, f"🔁 Updated *{PRODUCTS.get(pid, UNKNOWN_PRODUCT)['name']}* quantity to {qty}.")
+        turn.user["stage"] = "menu"
+        send_whatsapp_message(turn.phone, main_menu())
+    else:
+        send_whatsapp_message(turn.phone, "That product isn't in your cart.")
+
+@flow.on("awaiting_update", UNKNOWN, to="awaiting_update")
+def update_reprompt(turn):
+    send_whatsapp_message(turn.phone, f"Please enter a valid number (0 to remove, or up to {MAX_LINE_QUANTITY}).")
+
+FLOW_PROBLEMS = flow.validate()
+if FLOW_PROBLEMS:
+    raise RuntimeError("Invalid conversation table:\n" + "\n".join(FLOW_PROBLEMS))
+
+@app.cli.command("export-flows")
+@click.argument("output", type=click.File("w"), default="-")
+def export_flows_command(output):
+    """Write the conversation table as JSON."""
+    json.dump(flow.export(), output, indent=2, ensure_ascii=False)
+    output.write("\n")
+
+@app.cli.command("validate-flows")
+def validate_flows_command():
+    """Check the conversation table for missing or unknown stages."""
+    problems = flow.validate()
+    for problem in problems:
+        click.echo(problem)
+    click.echo("OK" if not problems else f"{len(problems)} problem(s)")
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    sessions = {"active": user_sessions.count()}
+    if isinstance(user_sessions, CachedSessionStore):
+        sessions.update(user_sessions.stats())
+    return jsonify({
+        "dedup": dedup.stats(),
+        "sessions": sessions,
+        "sweeper": session_sweeper.stats(),
+    }), 200
+
+# -------------------- Monitoring --------------------
+REGISTRY.gauge("sessions_active", "Sessions in the session store.", user_sessions.count)
+REGISTRY.gauge("outbound_pending", "Graph API messages queued or in flight.", outbound.pending)
+REGISTRY.gauge("n8n_outbox_size", "Orders waiting for delivery to n8n.", n8n_exporter.outbox.count)
+
+def by_kind(stats_fn):
+    return lambda: {(kind,): value for kind, value in stats_fn().items()}
+
+REGISTRY.gauge("dedup", "Message deduplicator counters.", by_kind(dedup.stats), labels=("kind",))
+REGISTRY.gauge("sweeper", "Session sweeper counters.", by_kind(session_sweeper.stats), labels=("kind",))
+if isinstance(user_sessions, CachedSessionStore):
+    REGISTRY.gauge("session_cache", "Session cache counters.", by_kind(user_sessions.stats), labels=("kind",))
+
+# Off unless PROFILER_TOKEN is set; the endpoint then answers only to that X-Profiler-Token header.
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+profiler = SamplingProfiler(entry_points={"incoming_messages", "handle_message"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/debug/profile", methods=["GET"])
+def profile():
+    """Sample the webhook path for ?seconds=N and return folded stacks for a flamegraph."""
+    # Header only: a query-string token would end up in access logs.
+    token = request.headers.get("X-Profiler-Token")
+    if not PROFILER_TOKEN or token != PROFILER_TOKEN:
+        abort(404)
+    try:
+        seconds = float(request.args.get("seconds", "10"))
+    except ValueError:
+        seconds = float("nan")
+    if not seconds > 0:
+        return jsonify({"status": "seconds must be a positive number"}), 400
+    seconds = min(seconds, 300)
+    if not profiler.start():
+        return jsonify({"status": "profiler already running"}), 409
+    try:
+        time.sleep(seconds)
+    finally:
+        stacks = profiler.stop()
+    return Response(stacks, mimetype="text/plain")
+
 # -------------------- Incoming messages --------------------
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "8"))
+
+# Different phones in one webhook batch are handled in parallel; each phone's
+# messages run in order on one worker, under that phone's session lock.
+batch_pool = ThreadPoolExecutor(max_workers=PROCESS_WORKERS, thread_name_prefix="webhook")
+
+def read_message(msg):
+    """Text of an incoming message, plus the reply id when it is a button or list tap."""
+    if msg.get("type") == "interactive":
+        interactive = msg.get("interactive", {})
+        tapped = interactive.get("button_reply") or interactive.get("list_reply") or {}
+        return normalize(tapped.get("title", "")), tapped.get("id")
+    return normalize(msg.get("text", {}).get("body", "")), None
+
+def handle_message(msg):
+    msg_id = msg.get("id")
+    if msg_id and dedup.seen(msg_id):
+        MESSAGES.inc("duplicate")
+        return
+    started = time.perf_counter()
+    phone = msg.get("from")
+    text, reply = read_message(msg)
+    try:
+        stage = handle_turn(phone, text, reply)
+    except Exception:
+        # Meta redelivers webhooks that fail; don't drop that retry as a duplicate.
+        if msg_id:
+            dedup.forget(msg_id)
+        raise
+    MESSAGES.inc("handled")
+    MESSAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+def handle_turn(phone, text, reply):
+    """Run one message through the flow under the phone's lock; returns the stage it arrived in."""
+    with user_sessions.lock(phone), buffered_replies(phone):
+        user = user_sessions.get(
+            phone,
+            {"cart": {}, "stage": "menu", "selected_product": None, "last_seen": 0},
+        )
+        stage = user.get("stage", "menu")
+        now = int(time.time())
+        last_seen = user.get("last_seen", 0)
+        user["last_seen"] = now
+        if last_seen and (now - last_seen) > SESSION_TIMEOUT_SECONDS:
+            user["stage"] = "menu"
+            send_whatsapp_message(
+                phone, "👋 Welcome back to *ShopEase!* (Session restarted after inactivity)"
+            )
+            send_whatsapp_message(phone, main_menu())
+        else:
+            flow.dispatch(phone, user, text, reply)
+        save_user_session(phone, user)
+    return stage
+
+def handle_phone_messages(msgs):
+    for msg in msgs:
+        handle_message(msg)
+
+def process_messages(messages):
+    by_phone = {}
+    for msg in messages:
+        by_phone.setdefault(msg.get("from"), []).append(msg)
+    if len(by_phone) == 1:
+        handle_phone_messages(messages)
+    else:
+        for _ in batch_pool.map(handle_phone_messages, by_phone.values()):
+            pass
+
 @app.route("/webhook", methods=["POST"])
 def incoming_messages():
+    with WEBHOOK_SECONDS.time():
+        return handle_webhook()
+
+def handle_webhook():
     data = request.get_json(force=True, silent=True)
     if not data:
         return jsonify({"status": "no data"}), 400
 
+    messages = []
     for entry in data.get("entry", []):
         for change in entry.get("changes", []):
-            value = change.get("value", {})
-            messages = value.get("messages", []) or []
-            for msg in messages:
-                phone = msg.get("from")
-                text_raw = msg.get("text", {}).get("body", "") or ""
-                text = text_raw.strip().lower()
-
-                user = user_sessions.get(
-                    phone,
-                    {"cart": {}, "stage": "menu", "selected_product": None, "last_seen": 0},
-                )
-                now = int(time.time())
-                last_seen = user.get("last_seen", 0)
-                if last_seen and (now - last_seen) > SESSION_TIMEOUT_SECONDS:
-                    user["stage"] = "menu"
-                    send_whatsapp_message(
-                        phone, "👋 Welcome back to *ShopEase!* (Session restarted after inactivity)"
-                    )
-                    send_whatsapp_message(phone, main_menu_text())
-                    user["last_seen"] = now
-                    user_sessions[phone] = user
-                    save_user_data(user_sessions)
-                    continue
-
-                user["last_seen"] = now
-                user_sessions[phone] = user
-                cart = user.setdefault("cart", {})
-
-                # --- Greetings ---
-                if text in ["hi", "hello", "hey", "start"]:
-                    send_whatsapp_message(phone, "👋 Hi there! Here's what I can do for you:")
-                    send_whatsapp_message(phone, main_menu_text())
-                    user["stage"] = "menu"
-                    save_user_data(user_sessions)
-                    continue
-
-                # --- NEW: Browse products from main menu ---
-                if text in ["1", "browse", "browse products", "browse our collection"]:
-                    send_whatsapp_message(phone, show_products_text())
-                    user["stage"] = "browsing"
-                    save_user_data(user_sessions)
-                    continue
-
-                # Awaiting quantity
-                if user.get("stage") == "awaiting_quantity":
-                    if text.isdigit() and int(text) > 0:
-                        qty = int(text)
-                        pid = user.get("selected_product")
-                        if pid and pid in PRODUCTS:
-                            cart[pid] = cart.get(pid, 0) + qty
-                            save_user_data(user_sessions)
-                            send_whatsapp_message(
-                                phone,
-                                f"✅ You have added *{qty} × {PRODUCTS[pid]['name']}* to your cart.",
-                            )
-                            send_whatsapp_message(
-                                phone,
-                                "Would you like to *continue shopping* or go to the *menu*?",
-                            )
-                            user["stage"] = "post_add_choice"
-                        else:
-                            send_whatsapp_message(
-                                phone, "❌ That product doesn't exist. Please reply with a valid product number."
-                            )
-                    else:
-                        send_whatsapp_message(phone, "❌ Please enter a valid quantity (a positive number).")
-                    save_user_data(user_sessions)
-                    continue
-
-                if user.get("stage") == "post_add_choice":
-                    if text in ["continue", "continue shopping", "1", "browse"]:
-                        send_whatsapp_message(phone, show_products_text())
-                        user["stage"] = "browsing"
-                    elif text in ["menu", "6", "help", "main menu"]:
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-                    else:
-                        send_whatsapp_message(
-                            phone, "Reply *continue* to keep shopping or *menu* to return to main menu."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                if user.get("stage") == "browsing":
-                    if text in PRODUCTS:
-                        user["selected_product"] = text
-                        user["stage"] = "awaiting_quantity"
-                        send_whatsapp_message(
-                            phone,
-                            f"How many *{PRODUCTS[text]['name']}* would you like to add? (enter a number)",
-                        )
-                    elif text in ["menu", "6", "help"]:
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-                    else:
-                        send_whatsapp_message(
-                            phone, "Reply with a *product number* to add it, or *menu* to return."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                # View cart
-                if text in ["2", "view cart", "cart"]:
-                    send_whatsapp_message(phone, cart_summary_text(cart))
-                    user["stage"] = "cart_view"
-                    save_user_data(user_sessions)
-                    continue
-
-                # --- FIXED cart_view section ---
-                if user.get("stage") == "cart_view":
-                    if text in ["checkout", "4", "proceed to checkout"]:
-                        if not cart:
-                            send_whatsapp_message(
-                                phone, "🛒 Your cart is empty. Browse products to add items first."
-                            )
-                            send_whatsapp_message(phone, show_products_text())
-                            user["stage"] = "browsing"
-                        else:
-                            total = sum(PRODUCTS[pid]["price"] * qty for pid, qty in cart.items())
-                            send_whatsapp_message(
-                                phone,
-                                f"💳 Your total is ₹{total}.\nReply *confirm* to complete purchase, or *cancel* to go back.",
-                            )
-                            user["stage"] = "awaiting_checkout_confirm"
-
-                    elif text in ["1", "browse", "browse products"]:
-                        send_whatsapp_message(phone, show_products_text())
-                        user["stage"] = "browsing"
-
-                    elif text in ["edit", "3", "modify cart", "edit cart"]:
-                        if not cart:
-                            send_whatsapp_message(
-                                phone, "🛒 Your cart is empty — nothing to modify.\nType *1* to browse products."
-                            )
-                            user["stage"] = "menu"
-                        else:
-                            msg = "*✏️ Modify Cart:*\n"
-                            for pid, qty in cart.items():
-                                p = PRODUCTS.get(pid, {"name": "Unknown", "price": 0})
-                                msg += f"{pid}. {p['name']} × {qty}\n"
-                            msg += "\nReply with the *product number* to update its quantity (0 to delete), or *menu* to return."
-                            send_whatsapp_message(phone, msg)
-                            user["stage"] = "modifying"
-
-                    elif text in ["menu", "6", "help"]:
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-
-                    else:
-                        send_whatsapp_message(
-                            phone,
-                            "Please reply with *1* to browse, *edit* to modify, *checkout* to pay, or *menu* to return.",
-                        )
-
-                    save_user_data(user_sessions)
-                    continue
-
-                # Checkout confirmation
-                if user.get("stage") == "awaiting_checkout_confirm":
-                    if text in ["confirm", "yes", "y"]:
-                        total = sum(PRODUCTS[pid]["price"] * qty for pid, qty in cart.items())
-                        export_to_n8n(phone, cart, stage="Completed")
-                        send_whatsapp_message(
-                            phone,
-                            f"✅ Checkout complete! Your card was charged ₹{total}.\nThank you for shopping with ShopEase! 🛍️",
-                        )
-                        user["cart"] = {}
-                        user["stage"] = "post_checkout_choice"
-                        send_whatsapp_message(phone, "Would you like to *continue shopping* or *exit*?")
-                    elif text in ["cancel", "no", "n", "menu"]:
-                        send_whatsapp_message(phone, "Checkout canceled. Returning to main menu.")
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-                    else:
-                        send_whatsapp_message(
-                            phone, "Reply *confirm* to complete purchase or *cancel* to return."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                if user.get("stage") == "post_checkout_choice":
-                    if text in ["continue", "continue shopping", "1", "browse"]:
-                        send_whatsapp_message(phone, show_products_text())
-                        user["stage"] = "browsing"
-                    elif text in ["exit", "quit", "no"]:
-                        send_whatsapp_message(
-                            phone,
-                            "Thanks for visiting ShopEase! If you need anything else, type *hi* or *menu* anytime.",
-                        )
-                        user["stage"] = "menu"
-                    else:
-                        send_whatsapp_message(
-                            phone, "Please reply *continue* to shop more or *exit* to finish."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                # Edit / modify cart
-                if text in ["3", "modify cart", "edit", "edit cart"]:
-                    if not cart:
-                        send_whatsapp_message(
-                            phone, "🛒 Your cart is empty — nothing to modify.\nType *1* to browse products."
-                        )
-                        user["stage"] = "menu"
-                    else:
-                        msg = "*✏️ Modify Cart:*\n"
-                        for pid, qty in cart.items():
-                            p = PRODUCTS.get(pid, {"name": "Unknown", "price": 0})
-                            msg += f"{pid}. {p['name']} × {qty}\n"
-                        msg += "\nReply with the *product number* to update its quantity (0 to delete), or *menu* to return."
-                        send_whatsapp_message(phone, msg)
-                        user["stage"] = "modifying"
-                    save_user_data(user_sessions)
-                    continue
-
-                if user.get("stage") == "modifying":
-                    if text in cart:
-                        user["selected_product"] = text
-                        user["stage"] = "awaiting_update"
-                        send_whatsapp_message(
-                            phone, f"Enter the new quantity for *{PRODUCTS[text]['name']}* (0 to remove):"
-                        )
-                    elif text in ["menu", "6", "help"]:
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-                    else:
-                        send_whatsapp_message(
-                            phone, "Reply with the product number in your cart, or *menu* to return."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                if user.get("stage") == "awaiting_update":
-                    if text.isdigit() and int(text) >= 0:
-                        qty = int(text)
-                        pid = user.get("selected_product")
-                        if pid and pid in cart:
-                            if qty == 0:
-                                del cart[pid]
-                                send_whatsapp_message(
-                                    phone, f"🗑️ Removed *{PRODUCTS[pid]['name']}* from your cart."
-                                )
-                            else:
-                                cart[pid] = qty
-                                send_whatsapp_message(
-                                    phone,
-                                    f"🔁 Updated *{PRODUCTS[pid]['name']}* quantity to {qty}.",
-                                )
-                            user["stage"] = "menu"
-                            send_whatsapp_message(phone, main_menu_text())
-                        else:
-                            send_whatsapp_message(phone, "That product isn't in your cart.")
-                    else:
-                        send_whatsapp_message(
-                            phone, "Please enter a valid number (0 to remove, or positive integer)."
-                        )
-                    save_user_data(user_sessions)
-                    continue
-
-                # Direct checkout from main menu
-                if text in ["4", "checkout", "proceed to checkout"]:
-                    if not cart:
-                        send_whatsapp_message(
-                            phone, "🛒 Your cart is empty — add items before checkout."
-                        )
-                        send_whatsapp_message(phone, main_menu_text())
-                        user["stage"] = "menu"
-                    else:
-                        total = sum(PRODUCTS[pid]["price"] * qty for pid, qty in cart.items())
-                        send_whatsapp_message(
-                            phone,
-                            f"💳 Your total is ₹{total}. Reply *confirm* to complete purchase or *cancel* to return.",
-                        )
-                        user["stage"] = "awaiting_checkout_confirm"
-                    save_user_data(user_sessions)
-                    continue
-
-                # Customer support
-                if text in ["5", "customer support", "support", "customer care"]:
-                    send_whatsapp_message(
-                        phone,
-                        "📞 Customer Support:\nCall: +91-9876543210\nEmail: support@shopease.com\n\nWe are available 9:00–18:00 IST.",
-                    )
-                    send_whatsapp_message(phone, "Anything else? Here's the main menu:")
-                    send_whatsapp_message(phone, main_menu_text())
-                    user["stage"] = "menu"
-                    save_user_data(user_sessions)
-                    continue
-
-                # Help / main menu
-                if text in ["6", "help", "menu", "main menu"]:
-                    send_whatsapp_message(phone, main_menu_text())
-                    user["stage"] = "menu"
-                    save_user_data(user_sessions)
-                    continue
-
-                # Fallback
-                send_whatsapp_message(
-                    phone, "😕 I didn't understand that. Here's the main menu to guide you:"
-                )
-                send_whatsapp_message(phone, main_menu_text())
-                user["stage"] = "menu"
-                save_user_data(user_sessions)
+            # Status-only changes (delivery/read receipts) carry no messages.
+            messages.extend(change.get("value", {}).get("messages") or [])
+    if messages:
+        refresh_catalog()
+        process_messages(messages)
 
     return jsonify({"status": "ok"}), 200
 
 
 if __name__ == "__main__":
     app.run(port=5000, debug=True)
-
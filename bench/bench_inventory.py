@@ -0,0 +1,105 @@
+# bench/bench_inventory.py
+# Many processes and threads racing for the same few SKUs: reserve, then
+# confirm or abandon, like shoppers during a flash sale. Checks that nothing
+# is oversold and every abandoned hold went back on the shelf.
+#   python bench/bench_inventory.py [--store sqlite|redis|both] [--processes 4] [--threads 8]
+#                                   [--shoppers 4000] [--stock 1000] [--skus 1] [--shards 8]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeRedis
+from inventory import open_inventory
+
+_inventory = None
+
+
+def init_worker(url, shards):
+    global _inventory
+    _inventory = open_inventory(url, shards=shards)
+
+
+def shop(args):
+    """Run one slice of shoppers; returns (units sold, rejected reserves, abandoned, seconds per op)."""
+    shoppers, skus, threads, seed = args
+    rng = random.Random(seed)
+    plans = [(f"{seed}-{i}", rng.choice(skus), rng.randint(1, 3), rng.random() < 0.2) for i in range(shoppers)]
+
+    def run(plan):
+        phone, sku, qty, abandon = plan
+        started = time.perf_counter()
+        if not _inventory.reserve(phone, sku, qty):
+            return 0, 1, 0, time.perf_counter() - started
+        if abandon:
+            _inventory.release_all(phone)
+            return 0, 0, 1, time.perf_counter() - started
+        if _inventory.commit(phone, {sku: qty}, phone):
+            # The hold covered it, so a shortage here is a bug.
+            raise AssertionError(f"commit failed for a held cart {plan}")
+        return qty, 0, 0, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(run, plans))
+    return (
+        sum(r[0] for r in results),
+        sum(r[1] for r in results),
+        sum(r[2] for r in results),
+        [r[3] for r in results],
+    )
+
+
+def bench(name, url, args):
+    skus = [f"hot-{i}" for i in range(args.skus)]
+    inventory = open_inventory(url, shards=args.shards)
+    for sku in skus:
+        inventory.set_stock(sku, args.stock)
+    per_process = args.shoppers // args.processes
+    t = time.perf_counter()
+    with get_context("spawn").Pool(args.processes, initializer=init_worker, initargs=(url, args.shards)) as pool:
+        results = pool.map(shop, [(per_process, skus, args.threads, seed) for seed in range(args.processes)])
+    elapsed = time.perf_counter() - t
+
+    sold = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    abandoned = sum(r[2] for r in results)
+    latencies = sorted(s for r in results for s in r[3])
+    left = sum(inventory.levels().values())
+    total = args.stock * len(skus)
+    ops = len(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{name}: {ops} shoppers in {elapsed:.2f}s ({ops / elapsed:.0f}/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms); "
+          f"sold {sold}/{total}, {left} left, {rejected} turned away, {abandoned} abandoned")
+    assert sold + left == total, f"stock leaked: sold {sold} + left {left} != {total}"
+    assert sold <= total, "oversold"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", choices=["sqlite", "redis", "both"], default="both",
+                        help="redis runs against fake_services.FakeRedis")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--shoppers", type=int, default=4000)
+    parser.add_argument("--stock", type=int, default=1000, help="units per SKU")
+    parser.add_argument("--skus", type=int, default=1, help="SKUs the shoppers spread over")
+    parser.add_argument("--shards", type=int, default=8, help="SQLite files the stock is split over")
+    args = parser.parse_args()
+
+    if args.store in ("sqlite", "both"):
+        bench("sqlite", f"sqlite:///{tempfile.mkdtemp(prefix='inventory-')}/inventory.db", args)
+    if args.store in ("redis", "both"):
+        with FakeRedis() as redis:
+            bench("redis", redis.url, args)
+
+
+if __name__ == "__main__":
+    main()
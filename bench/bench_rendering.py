@@ -0,0 +1,90 @@
+# bench/bench_rendering.py
+# Compares the rendering layer against the original string-building helpers.
+#   python bench/bench_rendering.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rendering import MAIN_MENU_TEXT, CatalogRenderer, cart_summary_text, modify_cart_text
+
+
+# -------------------- Original implementations --------------------
+def legacy_main_menu_text():
+    return (
+        "*🛍️ Welcome to ShopEase!* 👋\n\n"
+        "Choose an option:\n\n"
+        "1️⃣ *Browse Our Collection*\n"
+        "2️⃣ *View Cart*\n"
+        "3️⃣ *Edit Cart*\n"
+        "4️⃣ *Proceed to Checkout*\n"
+        "5️⃣ *Customer Support*\n"
+        "6️⃣ *Help / Main Menu*\n\n"
+        "Reply with the number or option name.\n(Type *menu* anytime to return here.)"
+    )
+
+def legacy_show_products_text(products):
+    msg = "*🛒 Available Products:*\n\n"
+    for pid, p in products.items():
+        msg += f"{pid}. {p['name']} — ₹{p['price']}\n"
+    msg += "\nReply with the *product number* to add it to your cart, or type *menu* to go back."
+    return msg
+
+def legacy_cart_summary_text(cart, products):
+    if not cart:
+        return "🛒 Your cart is empty.\n\nType *1* to browse products or *menu* to see options."
+    msg = "*🧺 Your Cart:*\n"
+    total = 0
+    count = 0
+    for pid, qty in cart.items():
+        p = products.get(pid, {"name": "Unknown", "price": 0})
+        msg += f"- {p['name']} × {qty} = ₹{p['price'] * qty}\n"
+        total += p["price"] * qty
+        count += qty
+    msg += f"\n*Items:* {count}\n*Total:* ₹{total}\n\nReply *checkout* to pay, *edit* to modify, or *menu* to return."
+    return msg
+
+def legacy_modify_cart_text(cart, products):
+    msg = "*✏️ Modify Cart:*\n"
+    for pid, qty in cart.items():
+        p = products.get(pid, {"name": "Unknown", "price": 0})
+        msg += f"{pid}. {p['name']} × {qty}\n"
+    msg += "\nReply with the *product number* to update its quantity (0 to delete), or *menu* to return."
+    return msg
+
+
+def make_catalog(n):
+    return {str(i): {"name": f"Product {i}", "price": 100 + i % 900} for i in range(1, n + 1)}
+
+
+def bench(label, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"  {label:<28} {seconds * 1e6:>12.2f} µs/call")
+    return seconds
+
+
+def main():
+    for n in (4, 1_000, 10_000, 50_000):
+        products = make_catalog(n)
+        cart = {str(i): i % 5 + 1 for i in range(1, min(n, 20) + 1)}
+        renderer = CatalogRenderer(products)
+        assert renderer.catalog_text() == legacy_show_products_text(products)
+        assert cart_summary_text(cart, products) == legacy_cart_summary_text(cart, products)
+        assert modify_cart_text(cart, products) == legacy_modify_cart_text(cart, products)
+        number = max(1, 20_000 // n)
+
+        print(f"catalog size {n}:")
+        old = bench("legacy show_products_text", lambda: legacy_show_products_text(products), number)
+        new = bench("CatalogRenderer (cached)", renderer.catalog_text, number * 100)
+        print(f"  {'speed-up':<28} {old / new:>12.0f}x")
+        bench("legacy main_menu_text", legacy_main_menu_text, 100_000)
+        bench("MAIN_MENU_TEXT", lambda: MAIN_MENU_TEXT, 100_000)
+        bench("legacy cart_summary_text", lambda: legacy_cart_summary_text(cart, products), 20_000)
+        bench("cart_summary_text", lambda: cart_summary_text(cart, products), 20_000)
+        bench("legacy modify cart text", lambda: legacy_modify_cart_text(cart, products), 20_000)
+        bench("modify_cart_text", lambda: modify_cart_text(cart, products), 20_000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench/bench_search.py
+# Product search build time and query latency as the catalog grows. Every
+# query is distinct, so no result can come from an earlier one.
+#   python bench/bench_search.py [--sizes 1000 10000 100000] [--queries 500]
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from search import SearchIndex
+
+BRANDS = ["Acme", "Zenith", "Nova", "Orbit", "Pulse", "Vertex", "Lumen", "Quark", "Atlas", "Echo"]
+ADJECTIVES = ["Wireless", "Bluetooth", "Portable", "Ergonomic", "Compact", "Pro", "Ultra", "Slim", "Smart", "Gaming"]
+NOUNS = ["Mouse", "Headphones", "Charger", "Stand", "Keyboard", "Speaker", "Cable", "Webcam", "Monitor", "Hub",
+         "Earbuds", "Adapter", "Powerbank", "Tripod", "Microphone", "Router", "Lamp", "Backpack", "Sleeve", "Dock"]
+COLORS = ["Black", "White", "Blue", "Red", "Grey", "Green"]
+
+WORDS = BRANDS + ADJECTIVES + NOUNS + COLORS
+
+
+def _typo(word, rng):
+    i = rng.randrange(1, len(word))
+    return word[:i] + word[i + 1:]
+
+
+QUERY_KINDS = {
+    "exact": lambda rng: f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}",
+    "prefix": lambda rng: f"{rng.choice(BRANDS)[:3]} {rng.choice(NOUNS)[:rng.randint(3, 5)]}",
+    "typo": lambda rng: f"{_typo(rng.choice(ADJECTIVES), rng)} {_typo(rng.choice(NOUNS), rng)}",
+    "multi-word": lambda rng: " ".join(rng.sample(WORDS, 3)),
+}
+
+
+def make_queries(kind, count, seed=11):
+    """Up to ``count`` distinct queries of one kind."""
+    rng = random.Random(seed)
+    queries = {}
+    for _ in range(count * 20):
+        queries[QUERY_KINDS[kind](rng).lower()] = None
+        if len(queries) >= count:
+            break
+    return list(queries)
+
+
+def make_catalog(n, seed=7):
+    rng = random.Random(seed)
+    for i in range(1, n + 1):
+        name = (f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} "
+                f"{rng.choice(COLORS)} SKU{i:06d}")
+        yield str(i), {"name": name, "price": rng.randint(99, 9999)}
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=500, help="distinct queries per kind")
+    args = parser.parse_args()
+
+    print(f"{'SKUs':>8} {'build':>8} {'kind':<11} {'p50 µs':>8} {'p99 µs':>8}")
+    for n in args.sizes:
+        t = time.perf_counter()
+        index = SearchIndex(make_catalog(n))
+        build = time.perf_counter() - t
+        for kind in QUERY_KINDS:
+            samples = []
+            for q in make_queries(kind, args.queries):
+                t = time.perf_counter()
+                index.search(q, limit=10)
+                samples.append((time.perf_counter() - t) * 1e6)
+            print(f"{n:>8} {build:>7.2f}s {kind:<11} {statistics.median(samples):>8.0f} {percentile(samples, 0.99):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# bench/load_test.py
+# Webhook load test: scripted conversations for many phones, replayed against
+# the app with a fake Graph API and fake n8n. Runs fully offline.
+#
+#   python bench/load_test.py --phones 200 --threads 16
+#   python bench/load_test.py --graph-latency 0.2 --graph-error-rate 0.05
+#   python bench/load_test.py --record payloads.jsonl     # save generated webhooks
+#   python bench/load_test.py --replay payloads.jsonl     # replay saved webhooks
+#   python bench/load_test.py --url http://127.0.0.1:5000/webhook   # real server
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeGraphAPI, FakeN8n
+
+PRODUCT_IDS = ["1", "2", "3", "4"]
+SEARCHES = ["mouse", "headphones", "charger", "laptop stand", "headfones"]
+_ids = itertools.count(1)
+
+
+# -------------------- Payload generation --------------------
+def conversation(rng):
+    """One customer journey as (text, stage the message is answered in)."""
+    steps = [("hi", "menu")]
+    if rng.random() < 0.3:
+        steps += [(rng.choice(SEARCHES), "menu"), (rng.choice(PRODUCT_IDS), "browsing")]
+    else:
+        steps += [("1", "menu"), (rng.choice(PRODUCT_IDS), "browsing")]
+    steps.append((str(rng.randint(1, 3)), "awaiting_quantity"))
+    for _ in range(rng.randint(0, 2)):
+        steps += [("continue", "post_add_choice"), (rng.choice(PRODUCT_IDS), "browsing"),
+                  (str(rng.randint(1, 3)), "awaiting_quantity")]
+    steps += [("menu", "post_add_choice"), ("2", "menu")]
+    if rng.random() < 0.2:
+        steps += [("edit", "cart_view"), ("menu", "modifying"), ("2", "menu")]
+    steps += [("checkout", "cart_view"), ("confirm", "awaiting_checkout_confirm"), ("exit", "post_checkout_choice")]
+    return steps
+
+
+def message(phone, text):
+    return {
+        "from": phone,
+        "id": f"wamid.load{next(_ids)}",
+        "timestamp": str(int(time.time())),
+        "type": "text",
+        "text": {"body": text},
+    }
+
+
+def webhook(messages):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "WABA_ID",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "PHONE_NUMBER_ID"},
+                    "contacts": [{"profile": {"name": "Load Test"}, "wa_id": m["from"]} for m in messages],
+                    "messages": messages,
+                },
+            }],
+        }],
+    }
+
+
+def generate(phones, seed):
+    """Per phone, the ordered list of (stage, payload) webhooks it sends."""
+    rng = random.Random(seed)
+    scripts = {}
+    for i in range(phones):
+        phone = f"9199{i:08d}"
+        scripts[phone] = [(stage, webhook([message(phone, text)])) for text, stage in conversation(rng)]
+    return scripts
+
+
+def load_recording(path):
+    scripts = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                scripts[record["phone"]].append((record.get("stage", "replay"), record["payload"]))
+    return dict(scripts)
+
+
+def save_recording(path, scripts):
+    with open(path, "w") as f:
+        for phone, steps in scripts.items():
+            for stage, payload in steps:
+                f.write(json.dumps({"phone": phone, "stage": stage, "payload": payload}) + "\n")
+
+
+# -------------------- Targets --------------------
+class InProcessTarget:
+    """Imports app.py against temp storage and the fakes; posts via the test client."""
+
+    def __init__(self, env):
+        os.environ.update(env)
+        import app
+
+        self.app = app
+        self.client = app.app.test_client()
+        self.components = defaultdict(float)
+        self._lock = threading.Lock()
+        app.flow.dispatch = self._timed("stage handler (incl. sends)", app.flow.dispatch)
+        app.save_user_session = self._timed("save_user_session", app.save_user_session)
+        app.send_whatsapp_message = self._timed("send_whatsapp_message", app.send_whatsapp_message)
+        app.export_to_n8n = self._timed("export_to_n8n", app.export_to_n8n)
+        app.refresh_catalog = self._timed("refresh_catalog", app.refresh_catalog)
+
+    def _timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t
+                with self._lock:
+                    self.components[name] += elapsed
+
+        return wrapper
+
+    def post(self, payload):
+        body = json.dumps(payload)
+        t = time.perf_counter()
+        json.loads(body)  # what request.get_json does with the raw body
+        parsed = time.perf_counter() - t
+        with self._lock:
+            self.components["JSON parsing"] += parsed
+        resp = self.client.post("/webhook", data=body, content_type="application/json")
+        return resp.status_code
+
+    def drain(self, timeout=60):
+        self.app.flush_outbound(timeout)
+        self.app.n8n_exporter.flush(timeout)
+
+
+class HttpTarget:
+    def __init__(self, url, threads):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=threads))
+        self.components = {}
+
+    def post(self, payload):
+        return self.session.post(self.url, json=payload, timeout=30).status_code
+
+    def drain(self, timeout=60):
+        pass
+
+
+# -------------------- Driver --------------------
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def run(target, scripts, threads):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def play(steps):
+        # One phone's messages go out strictly in order, like a real customer.
+        for stage, payload in steps:
+            t = time.perf_counter()
+            status = target.post(payload)
+            elapsed = (time.perf_counter() - t) * 1000
+            with lock:
+                latencies[stage].append(elapsed)
+                if status != 200:
+                    errors[stage] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(play, scripts.values()))
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(latencies, errors, elapsed, components, drain_seconds, fakes):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{total} webhook calls in {elapsed:.2f}s -> {total / elapsed:.0f} msg/s "
+          f"(outbound drain {drain_seconds:.2f}s)\n")
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    everything = []
+    for stage in sorted(latencies, key=lambda s: -len(latencies[s])):
+        samples = latencies[stage]
+        everything += samples
+        print(f"{stage:<28}{len(samples):>7}{statistics.median(samples):>9.2f}"
+              f"{percentile(samples, 0.95):>9.2f}{percentile(samples, 0.99):>9.2f}{errors[stage]:>8}")
+    print(f"{'all':<28}{len(everything):>7}{statistics.median(everything):>9.2f}"
+          f"{percentile(everything, 0.95):>9.2f}{percentile(everything, 0.99):>9.2f}{sum(errors.values()):>8}")
+    if components:
+        busy = sum(everything) / 1000
+        print("\ntime spent in (summed over all requests; sends are included in the stage handler):")
+        for name, seconds in sorted(components.items(), key=lambda c: -c[1]):
+            print(f"  {name:<32}{seconds:>8.2f}s {100 * seconds / busy:>6.1f}%")
+    for name, fake in fakes.items():
+        print(f"{name}: {len(fake.requests)} requests received")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16, help="phones in flight at once")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--graph-latency", type=float, default=0.05)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--n8n-latency", type=float, default=0.2)
+    parser.add_argument("--n8n-error-rate", type=float, default=0.0)
+    parser.add_argument("--url", help="POST to a running server instead of importing app.py")
+    parser.add_argument("--record", help="write the generated webhooks to this JSONL file and exit")
+    parser.add_argument("--replay", help="replay webhooks from a JSONL file written by --record")
+    args = parser.parse_args()
+
+    scripts = load_recording(args.replay) if args.replay else generate(args.phones, args.seed)
+    if args.record:
+        save_recording(args.record, scripts)
+        print(f"Wrote {sum(len(s) for s in scripts.values())} webhooks to {args.record}")
+        return
+
+    fakes = {}
+    if args.url:
+        target = HttpTarget(args.url, args.threads)
+    else:
+        fakes["fake Graph API"] = FakeGraphAPI(latency=args.graph_latency, error_rate=args.graph_error_rate).start()
+        fakes["fake n8n"] = FakeN8n(latency=args.n8n_latency, error_rate=args.n8n_error_rate, error_status=503).start()
+        tmp = tempfile.mkdtemp(prefix="loadtest-")
+        target = InProcessTarget({
+            "GRAPH_API_URL": fakes["fake Graph API"].url,
+            "N8N_WEBHOOK_URL": fakes["fake n8n"].url + "/webhook/whatsapp-order",
+            "SESSION_STORE_URL": f"sqlite:///{tmp}/sessions.db",
+            "N8N_OUTBOX_PATH": f"{tmp}/outbox.db",
+            "CART_ARCHIVE_PATH": f"{tmp}/abandoned_carts.db",
+            "INVENTORY_URL": f"sqlite:///{tmp}/inventory.db",
+            "ORDER_LEDGER_PATH": f"{tmp}/orders.db",
+        })
+
+    latencies, errors, elapsed = run(target, scripts, args.threads)
+    t = time.perf_counter()
+    target.drain()
+    drain_seconds = time.perf_counter() - t
+    report(latencies, errors, elapsed, target.components, drain_seconds, fakes)
+    for fake in fakes.values():
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench/stress_sessions.py
+# Replays interleaved conversations for many phones through several app
+# processes that share one session store, then checks every final cart.
+#   python bench/stress_sessions.py [--phones 500] [--processes 4] [--threads 8] [--store redis]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeGraphAPI, FakeRedis
+from session_store import open_session_store
+
+_client = None
+_store = None
+
+
+def init_worker(env):
+    global _client, _store
+    os.environ.update(env)
+    import app
+
+    _client = app.app.test_client()
+    _store = app.user_sessions
+
+
+def webhook(messages):
+    return {"entry": [{"changes": [{"value": {"messages": messages}}]}]}
+
+
+def post_batches(args):
+    batches, threads = args
+
+    def post(batch):
+        resp = _client.post("/webhook", json=webhook(batch))
+        assert resp.status_code == 200, resp.data
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(post, batches))
+    return len(batches)
+
+
+def bump_counter(args):
+    phone, rounds = args
+    for _ in range(rounds):
+        with _store.lock(phone):
+            session = _store.get(phone, {"n": 0})
+            session["n"] += 1
+            _store.put(phone, session)
+    return rounds
+
+
+def script_for(phone, rng, product_ids):
+    messages, cart = [], {}
+    messages += ["hi"]
+    for _ in range(2):
+        pid, qty = rng.choice(product_ids), rng.randint(1, 9)
+        messages += ["1", pid, str(qty), "menu"]
+        cart[pid] = cart.get(pid, 0) + qty
+    return messages, cart
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=500)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=20, help="messages per webhook call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--store", choices=["sqlite", "redis"], default="sqlite",
+                        help="shared session store; redis runs against fake_services.FakeRedis")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="stress-")
+    rng = random.Random(args.seed)
+    graph = FakeGraphAPI().start()
+    redis = FakeRedis().start() if args.store == "redis" else None
+    store_url = redis.url if redis else f"sqlite:///{tmp}/sessions.db"
+    env = {
+        "SESSION_STORE_URL": store_url,
+        "N8N_OUTBOX_PATH": f"{tmp}/outbox.db",
+        "INVENTORY_URL": f"sqlite:///{tmp}/inventory.db",
+        "ORDER_LEDGER_PATH": f"{tmp}/orders.db",
+        "CART_ARCHIVE_PATH": f"{tmp}/abandoned_carts.db",
+        "GRAPH_API_URL": graph.url,
+        "PROCESS_WORKERS": "8",
+        # Per-process session caches are not coherent across processes.
+        "SESSION_CACHE_SIZE": "0",
+    }
+    ctx = get_context("spawn")
+    with ctx.Pool(args.processes, initializer=init_worker, initargs=(env,)) as pool:
+        # 1. Lock check: every process and thread increments one shared counter.
+        rounds = 50
+        t = time.perf_counter()
+        pool.map(bump_counter, [("counter", rounds)] * (args.processes * args.threads))
+        counter = open_session_store(store_url).get("counter")["n"]
+        expected = rounds * args.processes * args.threads
+        print(f"lock: {counter}/{expected} increments in {time.perf_counter() - t:.2f}s")
+        assert counter == expected, "lost updates under session lock"
+
+        # 2. Conversations: in each round every phone sends its next two messages
+        # in one batch; batches mix phones and are spread over all processes.
+        product_ids = ["1", "2", "3", "4"]
+        scripts, expected_carts = {}, {}
+        for i in range(args.phones):
+            phone = f"91{i:08d}"
+            scripts[phone], expected_carts[phone] = script_for(phone, rng, product_ids)
+        total = sum(len(m) for m in scripts.values())
+        length = max(len(m) for m in scripts.values())
+        t = time.perf_counter()
+        for r in range(0, length, 2):
+            pending = []
+            for phone, msgs in scripts.items():
+                pending.append([
+                    {"from": phone, "id": f"{phone}-{j}", "text": {"body": body}}
+                    for j, body in enumerate(msgs[r:r + 2], start=r)
+                ])
+            rng.shuffle(pending)
+            batches = []
+            for i in range(0, len(pending), max(1, args.batch // 2)):
+                batches.append([m for group in pending[i:i + args.batch // 2] for m in group])
+            chunks = [(batches[i::args.processes], args.threads) for i in range(args.processes)]
+            pool.map(post_batches, chunks)
+        elapsed = time.perf_counter() - t
+
+    store = open_session_store(store_url)
+    wrong = [p for p, cart in expected_carts.items() if store.get(p, {}).get("cart") != cart]
+    graph.stop()
+    if redis:
+        redis.stop()
+    print(f"replay: {total} messages from {args.phones} phones in {elapsed:.2f}s "
+          f"({total / elapsed:.0f} msg/s), {len(wrong)} wrong carts")
+    if wrong:
+        print("first mismatch:", wrong[0], store.get(wrong[0]), expected_carts[wrong[0]])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# campaign.py
+# Broadcast sender for promotions and "your cart is waiting" nudges. Runs on
+# its own, next to the Flask server, against the same session store:
+#
+#   python campaign.py cart-nudge-oct                 # template cart_reminder: {{1}} = item count, {{2}} = total
+#   python campaign.py cart-nudge-oct --template cart_reminder --rate 80 --workers 16
+#   python campaign.py flash-sale --message "You left {item_count} item(s) worth ₹{total} in your cart!"
+#   python campaign.py cart-nudge-oct --status
+#
+# WhatsApp only delivers free-form text within 24 hours of the customer's
+# last message; outside that window it takes an approved template. So
+# template campaigns reach every cart, and --message campaigns only reach
+# customers seen in the last 24 hours.
+#
+# Progress is checkpointed per phone, so rerunning the same campaign name
+# after an interruption skips everyone already messaged.
+import argparse
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from catalog import Catalog
+from db import connect
+from outbound import OutboundDispatcher
+from rendering import cart_totals
+from session_store import open_session_store
+
+SERVICE_WINDOW_SECONDS = 24 * 3600
+TEMPLATE_FIELDS = ("item_count", "total")
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, bursting up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        # At least one token, or a rate below 1/s could never send.
+        self.capacity = max(1, burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# -------------------- Checkpoint --------------------
+class CampaignLog:
+    """Per-campaign record of which phones were messaged and how it went."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS campaign_sends ("
+            " campaign TEXT NOT NULL,"
+            " phone TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " sent_at REAL NOT NULL,"
+            " PRIMARY KEY (campaign, phone))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def done(self, campaign, phone):
+        row = self._conn().execute(
+            "SELECT 1 FROM campaign_sends WHERE campaign = ? AND phone = ? AND status = 'sent'",
+            (campaign, phone),
+        ).fetchone()
+        return row is not None
+
+    def record(self, campaign, phone, status):
+        self._conn().execute(
+            "INSERT INTO campaign_sends (campaign, phone, status, sent_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (campaign, phone) DO UPDATE SET status = excluded.status, sent_at = excluded.sent_at",
+            (campaign, phone, status, time.time()),
+        )
+
+    def summary(self, campaign):
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) FROM campaign_sends WHERE campaign = ? GROUP BY status", (campaign,)
+        ).fetchall()
+        return dict(rows)
+
+
+# -------------------- Campaign run --------------------
+def recipients(store):
+    """Phones with a non-empty cart and their sessions, streamed from the store."""
+    for phone, session in store.items():
+        if session.get("cart"):
+            yield phone, session
+
+
+class Campaign:
+    """Sends ``template`` (with ``params`` from the cart as body parameters) or,
+    without one, the free-form ``message`` to customers inside the 24-hour window."""
+
+    def __init__(self, name, message, store, products, dispatcher, log, rate=80, burst=None,
+                 max_in_flight=1000, report_every=5.0, template=None, language="en_US",
+                 params=TEMPLATE_FIELDS):
+        self.name = name
+        self.message = message
+        self.template = template
+        self.language = language
+        self.params = params
+        self.store = store
+        self.products = products
+        self.dispatcher = dispatcher
+        self.log = log
+        self.bucket = TokenBucket(rate, burst)
+        # Bounds the dispatcher queues so a huge store is never queued up in memory.
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.report_every = report_every
+        self.queued = 0
+        self.skipped = 0
+        self.outside_window = 0
+        self.sent = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def fields(self, cart):
+        item_count, total = cart_totals(cart, self.products)
+        return {"item_count": item_count, "total": total}
+
+    def render(self, cart):
+        return self.message.format(**self.fields(cart))
+
+    def payload(self, phone, cart):
+        if not self.template:
+            return {
+                "messaging_product": "whatsapp",
+                "to": phone,
+                "type": "text",
+                "text": {"body": self.render(cart)},
+            }
+        fields = self.fields(cart)
+        return {
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "type": "template",
+            "template": {
+                "name": self.template,
+                "language": {"code": self.language},
+                "components": [{
+                    "type": "body",
+                    "parameters": [{"type": "text", "text": str(fields[p])} for p in self.params],
+                }],
+            },
+        }
+
+    def _done(self, phone, ok):
+        self.log.record(self.name, phone, "sent" if ok else "failed")
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        self._in_flight.release()
+
+    def run(self, limit=None):
+        started = time.monotonic()
+        next_report = started + self.report_every
+        for phone, session in recipients(self.store):
+            if limit is not None and self.queued >= limit:
+                break
+            if not self.template and time.time() - session.get("last_seen", 0) > SERVICE_WINDOW_SECONDS:
+                # Free-form text would be rejected; a later run may still reach them.
+                self.outside_window += 1
+                continue
+            if self.log.done(self.name, phone):
+                self.skipped += 1
+                continue
+            payload = self.payload(phone, session["cart"])
+            self._in_flight.acquire()
+            self.bucket.acquire()
+            self.dispatcher.submit(phone, payload, callback=lambda ok, phone=phone: self._done(phone, ok))
+            self.queued += 1
+            if time.monotonic() >= next_report:
+                self.report(started)
+                next_report += self.report_every
+        self.dispatcher.flush()
+        self.report(started)
+        return self.failed == 0
+
+    def report(self, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(f"[{self.name}] queued {self.queued}, sent {self.sent}, failed {self.failed}, "
+              f"skipped {self.skipped} already sent, {self.outside_window} outside the 24h window, "
+              f"{self.sent / elapsed:.1f} msg/s")
+
+
+def positive_rate(value):
+    rate = float(value)
+    if not rate > 0:
+        raise argparse.ArgumentTypeError(f"rate must be above 0, got {value}")
+    return rate
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Send a message to every customer with items in their cart.")
+    parser.add_argument("name", help="campaign name; rerunning the same name resumes it")
+    parser.add_argument("--template", default=os.getenv("CAMPAIGN_TEMPLATE", "cart_reminder"),
+                        help="approved message template to send (default: $CAMPAIGN_TEMPLATE or cart_reminder)")
+    parser.add_argument("--language", default=os.getenv("CAMPAIGN_TEMPLATE_LANGUAGE", "en_US"),
+                        help="template language code")
+    parser.add_argument("--param", dest="params", action="append", choices=TEMPLATE_FIELDS,
+                        help="cart field for the next template body parameter, in order "
+                             "(default: item_count, total)")
+    parser.add_argument("--message", help="free-form text instead of a template, only sent to customers seen "
+                                          "in the last 24 hours; {item_count} and {total} are filled from the cart")
+    parser.add_argument("--rate", type=positive_rate, default=os.getenv("CAMPAIGN_RATE", "80"),
+                        help="messages per second (match your Graph API throughput tier)")
+    parser.add_argument("--burst", type=int, help="token bucket size; defaults to --rate")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent Graph API connections")
+    parser.add_argument("--limit", type=int, help="stop after queuing this many messages")
+    parser.add_argument("--log", default=os.getenv("CAMPAIGN_LOG_PATH", "campaigns.db"))
+    parser.add_argument("--status", action="store_true", help="print the campaign's progress and exit")
+    args = parser.parse_args()
+
+    log = CampaignLog(args.log)
+    if args.status:
+        print(f"[{args.name}] {log.summary(args.name) or 'not started'}")
+        return
+    if args.message:
+        args.template = None
+
+    store = open_session_store(os.getenv("SESSION_STORE_URL", "sqlite:///sessions.db"))
+    products = Catalog(os.getenv("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.jsonl")))
+    dispatcher = OutboundDispatcher(
+        f"{os.getenv('GRAPH_API_URL', 'https://graph.facebook.com')}/{os.getenv('VERSION', 'v23.0')}"
+        f"/{os.getenv('PHONE_NUMBER_ID')}/messages",
+        headers={
+            "Authorization": f"Bearer {os.getenv('ACCESS_TOKEN')}",
+            "Content-Type": "application/json",
+        },
+        workers=args.workers,
+    )
+    campaign = Campaign(args.name, args.message, store, products, dispatcher, log, rate=args.rate, burst=args.burst,
+                        template=args.template, language=args.language, params=args.params or TEMPLATE_FIELDS)
+    try:
+        ok = campaign.run(limit=args.limit)
+    except KeyboardInterrupt:
+        print("Interrupted; waiting for in-flight sends. Rerun the same campaign to resume.")
+        dispatcher.flush(30)
+        ok = False
+    dispatcher.shutdown()
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
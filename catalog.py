@@ -0,0 +1,230 @@
+# catalog.py
+import bisect
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from functools import lru_cache
+
+# One match per line: the span is the whole line, group 1 the product id.
+JSONL_LINE = re.compile(rb'^[^\n]*?"id"\s*:\s*"?([^",}\s]+)[^\n]*', re.MULTILINE)
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _normalize(record):
+    record["id"] = str(record["id"])
+    record["price"] = _number(str(record.get("price", 0)))
+    return record
+
+
+# -------------------- Sources --------------------
+# A source lists product ids in catalog order without decoding the records,
+# and decodes single records on demand.
+def _read(path):
+    # A private copy, not an mmap: the file may be rewritten in place while
+    # this snapshot is still serving, and a mapping would see the new bytes
+    # at the old offsets (or SIGBUS past a shortened end).
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class JsonlSource:
+    def __init__(self, path):
+        self.path = path
+        self._buf = _read(path)
+        self.offsets = {}
+        self.ids = []
+        for m in JSONL_LINE.finditer(self._buf):
+            pid = m.group(1).decode()
+            self.offsets[pid] = m.span()
+            self.ids.append(pid)
+
+    def load(self, pid):
+        start, end = self.offsets[pid]
+        return _normalize(json.loads(self._buf[start:end]))
+
+    def scan(self):
+        for pid in self.ids:
+            yield self.load(pid)
+
+
+class CsvSource:
+    def __init__(self, path):
+        self.path = path
+        self._buf = _read(path)
+        buf = self._buf
+        header_end = buf.find(b"\n")
+        if header_end == -1:
+            header_end = len(buf)
+        self.fields = next(csv.reader([buf[:header_end].decode().strip()]), [])
+        self.offsets = {}
+        self.ids = []
+        start = header_end + 1
+        while start < len(buf):
+            end = buf.find(b"\n", start)
+            if end == -1:
+                end = len(buf)
+            comma = buf.find(b",", start, end)
+            pid = buf[start:comma if comma != -1 else end].strip().strip(b'"').decode()
+            if pid:
+                self.offsets[pid] = (start, end)
+                self.ids.append(pid)
+            start = end + 1
+
+    def load(self, pid):
+        start, end = self.offsets[pid]
+        row = next(csv.reader([self._buf[start:end].decode().rstrip("\r")]))
+        return _normalize(dict(zip(self.fields, row)))
+
+    def scan(self):
+        for pid in self.ids:
+            yield self.load(pid)
+
+
+class SqliteSource:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.ids = [str(r[0]) for r in self._conn().execute("SELECT id FROM products ORDER BY rowid")]
+        self.offsets = dict.fromkeys(self.ids)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def load(self, pid):
+        row = self._conn().execute("SELECT * FROM products WHERE id = ?", (pid,)).fetchone()
+        return _normalize(dict(row))
+
+    def scan(self):
+        for row in self._conn().execute("SELECT * FROM products ORDER BY rowid"):
+            yield _normalize(dict(row))
+
+
+SOURCES = {".jsonl": JsonlSource, ".csv": CsvSource, ".db": SqliteSource, ".sqlite": SqliteSource}
+
+
+def open_source(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SOURCES:
+        raise ValueError(f"Unsupported catalog format: {path}")
+    return SOURCES[ext](path)
+
+
+# -------------------- Catalog --------------------
+class _Snapshot:
+    def __init__(self, source, version, cache_size):
+        self.source = source
+        self.version = version
+        self.load = lru_cache(maxsize=cache_size)(source.load)
+        self.categories = None
+        self.prices = None
+        self.lock = threading.Lock()
+
+    def build_indexes(self):
+        with self.lock:
+            if self.categories is not None:
+                return
+            categories = {}
+            prices = []
+            for p in self.source.scan():
+                categories.setdefault(str(p.get("category", "")).lower(), []).append(p["id"])
+                prices.append((p["price"], p["id"]))
+            prices.sort()
+            self.prices = prices
+            self.categories = categories
+
+
+class Catalog(Mapping):
+    """Read-only ``product id -> record`` mapping backed by a data file.
+
+    Only product ids are indexed at startup; records are decoded on first
+    access and kept in an LRU cache. Category and price indexes are built on
+    first use. ``reload_if_changed`` swaps in a new snapshot when the file
+    changes, bumping ``version``.
+    """
+
+    def __init__(self, path, cache_size=10_000, reload_interval=5.0):
+        self.path = path
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self._stamp = self._file_stamp()
+        self._checked_at = time.monotonic()
+        self._snap = _Snapshot(open_source(path), 1, cache_size)
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    @property
+    def version(self):
+        return self._snap.version
+
+    def reload_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+        stamp = self._file_stamp()
+        if stamp == self._stamp and not force:
+            return False
+        snap = _Snapshot(open_source(self.path), self._snap.version + 1, self.cache_size)
+        self._stamp = stamp
+        self._snap = snap
+        print(f"Catalog reloaded: {len(snap.source.ids)} products (version {snap.version}).")
+        return True
+
+    def __getitem__(self, pid):
+        snap = self._snap
+        if pid not in snap.source.offsets:
+            raise KeyError(pid)
+        return snap.load(pid)
+
+    def __contains__(self, pid):
+        return pid in self._snap.source.offsets
+
+    def __iter__(self):
+        return iter(self._snap.source.ids)
+
+    def __len__(self):
+        return len(self._snap.source.ids)
+
+    def records(self):
+        # Full scan that bypasses the record cache, for building derived indexes.
+        return self._snap.source.scan()
+
+    def page_count(self, page_size):
+        return max(1, -(-len(self) // page_size))
+
+    def page(self, page, page_size):
+        snap = self._snap
+        ids = snap.source.ids[page * page_size:(page + 1) * page_size]
+        return [(pid, snap.load(pid)) for pid in ids]
+
+    def by_category(self, category):
+        snap = self._snap
+        if snap.categories is None:
+            snap.build_indexes()
+        return snap.categories.get(category.lower(), [])
+
+    def in_price_range(self, low, high):
+        snap = self._snap
+        if snap.prices is None:
+            snap.build_indexes()
+        i = bisect.bisect_left(snap.prices, (low, ""))
+        j = bisect.bisect_right(snap.prices, (high, "\uffff"))
+        return [pid for _, pid in snap.prices[i:j]]
@@ -0,0 +1,210 @@
+# conversation.py
+from collections import namedtuple
+
+ANY = "*"
+UNKNOWN = "unknown"
+
+STAGES = (
+    "menu",
+    "browsing",
+    "awaiting_quantity",
+    "post_add_choice",
+    "cart_view",
+    "awaiting_checkout_confirm",
+    "post_checkout_choice",
+    "modifying",
+    "awaiting_update",
+)
+
+# -------------------- Intent vocabulary --------------------
+# Free-text synonyms that mean the same thing in every stage.
+GLOBAL_INTENTS = {
+    **dict.fromkeys(["hi", "hello", "hey", "start"], "greet"),
+    **dict.fromkeys(["1", "browse", "browse products", "browse our collection"], "browse"),
+    **dict.fromkeys(["2", "view cart", "cart"], "view_cart"),
+    **dict.fromkeys(["3", "modify cart", "edit", "edit cart"], "edit_cart"),
+    **dict.fromkeys(["4", "checkout", "proceed to checkout"], "checkout"),
+    **dict.fromkeys(["5", "customer support", "support", "customer care"], "support"),
+    **dict.fromkeys(["6", "help", "menu", "main menu"], "menu"),
+    **dict.fromkeys(["7", "reorder", "order again", "buy again", "repeat order"], "reorder"),
+}
+
+# Words whose meaning depends on the stage; these win over GLOBAL_INTENTS.
+STAGE_INTENTS = {
+    "browsing": {
+        **dict.fromkeys(["next", "more", "n", ">"], "next_page"),
+        **dict.fromkeys(["prev", "previous", "p", "<"], "prev_page"),
+    },
+    "post_add_choice": dict.fromkeys(["continue", "continue shopping"], "browse"),
+    "awaiting_checkout_confirm": {
+        **dict.fromkeys(["confirm", "yes", "y"], "confirm"),
+        **dict.fromkeys(["cancel", "no", "n", "menu"], "cancel"),
+    },
+    "post_checkout_choice": {
+        **dict.fromkeys(["continue", "continue shopping"], "browse"),
+        **dict.fromkeys(["exit", "quit", "no"], "exit"),
+    },
+}
+
+# Stages that read a number as data rather than a menu choice.
+NUMBER_SLOTS = {
+    "browsing": "product",
+    "awaiting_quantity": "quantity",
+    "modifying": "cart_item",
+    "awaiting_update": "quantity",
+}
+
+# "search mouse" / "find usb charger" searches from any stage.
+SEARCH_PREFIXES = ("search ", "find ")
+
+
+def normalize(text):
+    return (text or "").strip().lower()
+
+
+def resolve_intent(stage, text):
+    intent = STAGE_INTENTS.get(stage, {}).get(text)
+    if intent:
+        return intent
+    if text.startswith(SEARCH_PREFIXES):
+        return "search"
+    if text.isdecimal() and stage in NUMBER_SLOTS:
+        return NUMBER_SLOTS[stage]
+    return GLOBAL_INTENTS.get(text, UNKNOWN)
+
+
+# -------------------- Interactive reply ids --------------------
+# Buttons and list rows carry "<stage code>:<intent>[:<argument>]" ids, so a
+# tap resolves without text matching. Codes must stay stable: old buttons
+# remain tappable in the customer's chat history.
+STAGE_CODES = {
+    ANY: "*",
+    "menu": "m",
+    "browsing": "b",
+    "awaiting_quantity": "q",
+    "post_add_choice": "a",
+    "cart_view": "c",
+    "awaiting_checkout_confirm": "k",
+    "post_checkout_choice": "p",
+    "modifying": "e",
+    "awaiting_update": "u",
+}
+CODE_STAGES = {code: stage for stage, code in STAGE_CODES.items()}
+
+
+def reply_id(stage, intent, arg=""):
+    code = STAGE_CODES[stage]
+    return f"{code}:{intent}:{arg}" if arg else f"{code}:{intent}"
+
+
+def parse_reply_id(value):
+    """``(stage, intent, argument)`` for an id made by ``reply_id``, else None."""
+    parts = (value or "").split(":", 2)
+    if len(parts) < 2 or parts[0] not in CODE_STAGES:
+        return None
+    return CODE_STAGES[parts[0]], parts[1], parts[2] if len(parts) == 3 else ""
+
+
+def search_query(text):
+    for prefix in SEARCH_PREFIXES:
+        if text.startswith(prefix):
+            return text[len(prefix):].strip()
+    return text
+
+
+# -------------------- Dispatch table --------------------
+Transition = namedtuple("Transition", "stage intent handler targets")
+Turn = namedtuple("Turn", "phone user cart text intent")
+
+
+class FlowTable:
+    """``(stage, intent) -> handler`` table.
+
+    Lookups fall back from ``(stage, intent)`` to ``(ANY, intent)``, then to
+    the stage's ``UNKNOWN`` handler and finally ``(ANY, UNKNOWN)``. Each entry
+    declares the stages its handler may move the user to, so the table can be
+    exported and checked without running the bot.
+    """
+
+    def __init__(self):
+        self.transitions = {}
+
+    def on(self, stage, intents, to):
+        if isinstance(intents, str):
+            intents = [intents]
+        targets = frozenset([to] if isinstance(to, str) else to)
+
+        def register(handler):
+            for intent in intents:
+                key = (stage, intent)
+                if key in self.transitions:
+                    raise ValueError(f"Duplicate transition for {key}")
+                self.transitions[key] = Transition(stage, intent, handler, targets)
+            return handler
+
+        return register
+
+    def lookup(self, stage, intent):
+        t = self.transitions
+        return (
+            t.get((stage, intent))
+            or t.get((ANY, intent))
+            or t.get((stage, UNKNOWN))
+            or t[(ANY, UNKNOWN)]
+        )
+
+    def dispatch(self, phone, user, text, reply=None):
+        stage = user.get("stage", "menu")
+        parsed = parse_reply_id(reply) if reply else None
+        if parsed and parsed[0] in (stage, ANY):
+            _, intent, arg = parsed
+            text = arg or text
+            if intent == "quantity" and not text.isdecimal():
+                # A malformed or forged id; quantity handlers expect digits.
+                intent = UNKNOWN
+        else:
+            # Typed text, or a button left over from an earlier step: read its title.
+            intent = resolve_intent(stage, text)
+        transition = self.lookup(stage, intent)
+        transition.handler(Turn(phone, user, user.setdefault("cart", {}), text, intent))
+        if user.get("stage") not in transition.targets:
+            print(f"⚠️ {transition.handler.__name__} moved {phone} to undeclared stage {user.get('stage')!r}")
+        return transition
+
+    def export(self):
+        return {
+            "stages": list(STAGES),
+            "global_intents": GLOBAL_INTENTS,
+            "stage_intents": STAGE_INTENTS,
+            "number_slots": NUMBER_SLOTS,
+            "transitions": [
+                {
+                    "stage": t.stage,
+                    "intent": t.intent,
+                    "handler": t.handler.__name__,
+                    "to": sorted(t.targets),
+                }
+                for t in self.transitions.values()
+            ],
+        }
+
+    def validate(self):
+        problems = []
+        known = set(STAGES) | {ANY}
+        if (ANY, UNKNOWN) not in self.transitions:
+            problems.append(f"missing fallback transition ({ANY!r}, {UNKNOWN!r})")
+        for t in self.transitions.values():
+            if t.stage not in known:
+                problems.append(f"{t.handler.__name__}: unknown stage {t.stage!r}")
+            for target in t.targets - set(STAGES):
+                problems.append(f"{t.handler.__name__}: unknown target stage {target!r}")
+        intents = set(GLOBAL_INTENTS.values()) | set(NUMBER_SLOTS.values()) | {"search"}
+        for vocab in STAGE_INTENTS.values():
+            intents |= set(vocab.values())
+        handled = {intent for _, intent in self.transitions}
+        for intent in sorted(intents - handled):
+            problems.append(f"intent {intent!r} has no transition")
+        for stage, slot in NUMBER_SLOTS.items():
+            if (stage, slot) not in self.transitions and (ANY, slot) not in self.transitions:
+                problems.append(f"stage {stage!r} reads {slot!r} but has no transition for it")
+        return problems
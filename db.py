@@ -0,0 +1,28 @@
+# db.py
+import random
+import sqlite3
+import time
+
+
+def connect(path, timeout=30):
+    """Autocommit connection to ``path`` in WAL mode.
+
+    Switching a new file to WAL needs an exclusive lock, and SQLite can
+    report "database is locked" for it without waiting on the busy timeout.
+    Processes that open the same new file at once (gunicorn workers booting
+    side by side) retry here for up to ``timeout`` seconds instead of failing.
+    """
+    deadline = time.monotonic() + timeout
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    delay = 0.01
+    while True:
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return conn
+        except sqlite3.OperationalError as e:
+            busy = "locked" in str(e) or "busy" in str(e)
+            if not busy or time.monotonic() >= deadline:
+                conn.close()
+                raise
+        time.sleep(delay * (1 + random.random()))
+        delay = min(delay * 2, 0.5)
@@ -0,0 +1,96 @@
+# dedup.py
+import threading
+import time
+from collections import OrderedDict
+
+from db import connect
+
+
+class MessageDeduplicator:
+    """Remembers WhatsApp message ids for ``ttl`` seconds (LRU-bounded).
+
+    With ``path`` set, ids are also recorded in SQLite, so redeliveries are
+    caught across restarts and across worker processes sharing the file.
+    ``claim(message_id, ttl)`` plugs in another shared record instead (e.g.
+    ``RedisSessionStore.claim``); it returns False for ids already claimed,
+    and ``unclaim(message_id)`` undoes it for ``forget``.
+    """
+
+    def __init__(self, max_size=100_000, ttl=24 * 3600, path=None, claim=None, unclaim=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.claim = claim
+        self.unclaim = unclaim
+        self.hits = 0
+        self.misses = 0
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS seen_messages (message_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def seen(self, message_id):
+        """Record ``message_id``; return True if it was already processed."""
+        now = time.time()
+        with self._lock:
+            seen_at = self._seen.get(message_id)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._seen.move_to_end(message_id)
+                self.hits += 1
+                return True
+            self._seen[message_id] = now
+            self._seen.move_to_end(message_id)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+        if self.claim is not None:
+            claimed = self.claim(message_id, self.ttl)
+        else:
+            claimed = not self.path or self._claim(message_id, now)
+        if not claimed:
+            with self._lock:
+                self.hits += 1
+            return True
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def _claim(self, message_id, now):
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM seen_messages WHERE message_id = ? AND seen_at < ?",
+            (message_id, now - self.ttl),
+        )
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO seen_messages (message_id, seen_at) VALUES (?, ?)",
+            (message_id, now),
+        )
+        return cur.rowcount == 1
+
+    def forget(self, message_id):
+        """Undo ``seen`` for a message whose handling failed, so a redelivery is processed."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+        if self.claim is not None:
+            if self.unclaim is not None:
+                self.unclaim(message_id)
+        elif self.path:
+            self._conn().execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
+
+    def purge(self):
+        """Drop expired ids from the persistent table."""
+        if self.path:
+            self._conn().execute("DELETE FROM seen_messages WHERE seen_at < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._seen), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,371 @@
+# fake_services.py
+# Local stand-ins for the Graph API, n8n and Redis so the bot can be exercised offline.
+import argparse
+import itertools
+import json
+import random
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients (e.g. a benchmark's worker processes) may hang up mid-request.
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeEndpoint:
+    """Records every JSON POST and answers after ``latency`` seconds.
+
+    ``error_rate`` of the requests are answered with ``error_status``
+    (429 by default, like Graph API throttling).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, error_status=429):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, reply = fake.handle(self.path, dict(self.headers), body)
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, path, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status, {"error": {"message": "fake failure"}}
+        with self._lock:
+            self.requests.append({"path": path, "headers": headers, "body": body})
+        return 200, self.reply(body)
+
+    def reply(self, body):
+        return {"status": "ok"}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeGraphAPI(FakeEndpoint):
+    def reply(self, body):
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.fake{next(self._ids)}"}],
+        }
+
+    def messages_to(self, phone):
+        return [r["body"] for r in self.requests if r["body"].get("to") == phone]
+
+
+class FakeN8n(FakeEndpoint):
+    pass
+
+
+# -------------------- Fake Redis --------------------
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class _Status(str):
+    pass
+
+
+class _Error(str):
+    pass
+
+
+OK = _Status("OK")
+
+
+class FakeRedis:
+    """In-memory server speaking the Redis protocol (RESP2).
+
+    Covers what RedisSessionStore uses: strings with NX/EX/PX, MGET, sorted
+    sets and WATCH/MULTI/EXEC. Every command runs under one lock, so it is
+    atomic like on a real single-threaded Redis.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}  # bumped on every write, for WATCH
+        self.commands = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                state = {"multi": None, "watched": {}}
+                while True:
+                    args = fake._read_command(self.rfile)
+                    if args is None:
+                        return
+                    self.wfile.write(fake._encode(fake.dispatch(args, state)))
+
+        self.server = _TCPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def _read_command(rfile):
+        line = rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            n = int(rfile.readline()[1:])
+            args.append(rfile.read(n + 2)[:-2].decode())
+        return args
+
+    def _encode(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, _Error):
+            return f"-{value}\r\n".encode()
+        if isinstance(value, _Status):
+            return f"+{value}\r\n".encode()
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(self._encode(v) for v in value)
+        data = str(value).encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def dispatch(self, args, state):
+        name = args[0].upper()
+        if state["multi"] is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            state["multi"].append(args)
+            return _Status("QUEUED")
+        if name == "MULTI":
+            state["multi"] = []
+            return OK
+        if name in ("DISCARD", "UNWATCH"):
+            if name == "DISCARD":
+                state["multi"] = None
+            state["watched"] = {}
+            return OK
+        with self._lock:
+            self.commands += 1
+            if name == "WATCH":
+                for key in args[1:]:
+                    self._alive(key)
+                    state["watched"][key] = self.versions.get(key, 0)
+                return OK
+            if name == "EXEC":
+                queued, state["multi"] = state["multi"], None
+                watched, state["watched"] = state["watched"], {}
+                if queued is None:
+                    return _Error("ERR EXEC without MULTI")
+                for key in watched:
+                    self._alive(key)
+                if any(self.versions.get(k, 0) != v for k, v in watched.items()):
+                    return None
+                return [self._run(a) for a in queued]
+            return self._run(args)
+
+    # Called with the lock held.
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._delete(key)
+        return key in self.data
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _delete(self, key):
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        self._touch(key)
+
+    def _zset(self, key):
+        self._alive(key)
+        value = self.data.setdefault(key, {})
+        return value if isinstance(value, dict) else None
+
+    def _sorted(self, zset):
+        return sorted(zset, key=lambda m: (zset[m], m))
+
+    @staticmethod
+    def _bound(text):
+        if text in ("-inf", "+inf", "inf"):
+            return float(text), False
+        if text.startswith("("):
+            return float(text[1:]), True
+        return float(text), False
+
+    def _run(self, args):
+        name, args = args[0].upper(), args[1:]
+        if name == "PING":
+            return _Status("PONG")
+        if name in ("AUTH", "SELECT"):
+            return OK
+        if name == "FLUSHDB":
+            for key in list(self.data):
+                self._delete(key)
+            return OK
+        if name == "GET":
+            return self.data.get(args[0]) if self._alive(args[0]) else None
+        if name == "MGET":
+            return [self.data.get(k) if self._alive(k) else None for k in args]
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            exists = self._alive(key)
+            if ("NX" in options and exists) or ("XX" in options and not exists):
+                return None
+            self.data[key] = value
+            self.expires.pop(key, None)
+            for unit, scale in (("EX", 1.0), ("PX", 0.001)):
+                if unit in options:
+                    self.expires[key] = time.time() + float(args[2 + options.index(unit) + 1]) * scale
+            self._touch(key)
+            return OK
+        if name == "DEL":
+            removed = 0
+            for key in args:
+                if self._alive(key):
+                    self._delete(key)
+                    removed += 1
+            return removed
+        if name == "EXISTS":
+            return sum(1 for key in args if self._alive(key))
+        if name in ("INCRBY", "DECRBY"):
+            key = args[0]
+            try:
+                current = int(self.data[key]) if self._alive(key) else 0
+                delta = int(args[1])
+            except (TypeError, ValueError):
+                return _Error("ERR value is not an integer or out of range")
+            value = current + delta if name == "INCRBY" else current - delta
+            self.data[key] = str(value)
+            self._touch(key)
+            return value
+        if name in ("ZADD", "ZREM", "ZCARD", "ZRANGE", "ZRANGEBYSCORE"):
+            zset = self._zset(args[0])
+            if zset is None:
+                return _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+            if name == "ZADD":
+                added = 0
+                for score, member in zip(args[1::2], args[2::2]):
+                    added += member not in zset
+                    zset[member] = float(score)
+                self._touch(args[0])
+                return added
+            if name == "ZREM":
+                removed = sum(1 for member in args[1:] if zset.pop(member, None) is not None)
+                self._touch(args[0])
+                return removed
+            if name == "ZCARD":
+                return len(zset)
+            members = self._sorted(zset)
+            if name == "ZRANGE":
+                start, stop = int(args[1]), int(args[2])
+                stop = len(members) + stop if stop < 0 else stop
+                return members[start:stop + 1]
+            (low, low_open), (high, high_open) = self._bound(args[1]), self._bound(args[2])
+            members = [
+                m for m in members
+                if (zset[m] > low if low_open else zset[m] >= low)
+                and (zset[m] < high if high_open else zset[m] <= high)
+            ]
+            if len(args) >= 6 and args[3].upper() == "LIMIT":
+                offset, count = int(args[4]), int(args[5])
+                members = members[offset:] if count < 0 else members[offset:offset + count]
+            return members
+        return _Error(f"ERR unknown command '{name}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Graph API, n8n endpoint or Redis server.")
+    parser.add_argument("service", choices=["graph", "n8n", "redis"])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.service == "redis":
+        fake = FakeRedis(port=args.port)
+    else:
+        cls = FakeGraphAPI if args.service == "graph" else FakeN8n
+        fake = cls(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Fake {args.service} listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = 30
+graceful_timeout = 30  # lets workers drain queued sends on shutdown
+keepalive = 5
+# Import the app in each worker, after fork: SQLite connections, sockets and
+# background threads must not be shared across processes.
+preload_app = False
+accesslog = "-"
+
+if workers > 1:
+    # A per-process session cache would serve stale sessions written by other
+    # workers, and in-memory dedup would miss redeliveries landing elsewhere.
+    os.environ.setdefault("SESSION_CACHE_SIZE", "0")
+    os.environ.setdefault("DEDUP_DB_PATH", "dedup.db")
@@ -0,0 +1,542 @@
+# inventory.py
+# Per-SKU stock with time-limited reservations for items sitting in carts.
+# SKUs without a stock record are not tracked and never run out.
+#
+#   python inventory.py set 1 250          # 250 units of product 1 free to sell
+#   python inventory.py add 1 50           # restock
+#   python inventory.py load products.jsonl   # take "stock" fields from a catalog file
+#   python inventory.py show
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from db import connect
+from resp import RespClient
+
+# How long a sold order id is remembered, so a retried checkout isn't sold twice.
+ORDER_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class Inventory(ABC):
+    """Stock counters plus holds on them per phone.
+
+    ``reserve`` moves units from free stock into the phone's hold and
+    refreshes the hold's expiry; ``commit`` turns a cart into sold units
+    all at once or not at all; ``release_expired`` returns holds nobody
+    has touched for ``hold_seconds``. Backends update each counter with a
+    conditional write instead of a process-wide lock.
+    """
+
+    def __init__(self, hold_seconds=15 * 60):
+        self.hold_seconds = hold_seconds
+
+    @abstractmethod
+    def set_stock(self, sku, available):
+        """Set the units free to sell, on top of what is currently held."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_stock(self, sku, quantity):
+        raise NotImplementedError
+
+    @abstractmethod
+    def available(self, sku):
+        """Free units, or None when ``sku`` is not tracked."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def reserve(self, phone, sku, quantity):
+        """Hold ``quantity`` more units for ``phone``; False if not enough are free."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self, phone, sku, quantity=None):
+        """Give back ``quantity`` held units (all of them when None)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_all(self, phone):
+        raise NotImplementedError
+
+    @abstractmethod
+    def commit(self, phone, cart, order_id):
+        """Sell ``cart`` from the phone's hold, topping up from free stock.
+
+        Returns ``[(sku, units available to this phone), ...]`` for items that
+        fall short, in which case nothing is sold and the hold is untouched.
+        Items already sold under ``order_id`` are not sold again, so retrying
+        an order that failed after (or partway through) its commit finishes it
+        instead of repeating it.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_expired(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def levels(self):
+        """``{sku: free units}`` for every tracked SKU."""
+        raise NotImplementedError
+
+
+# -------------------- SQLite backend --------------------
+class _Shortage(Exception):
+    def __init__(self, shortages):
+        super().__init__(shortages)
+        self.shortages = shortages
+
+
+class SQLiteInventory(Inventory):
+    """Stock and holds split by SKU hash over ``shards`` SQLite files.
+
+    Each file has its own write lock, so carts for SKUs in different shards
+    never wait on each other; within a process, threads queue on a lock per
+    shard rather than in SQLite's sleeping busy handler. Stock updates only
+    apply ``WHERE on_hand - reserved >= quantity``, so a counter never goes
+    below zero. Calls that turn out to have nothing to change (untracked
+    SKUs, no holds) only read. Shard 0 lives at ``path`` and records the
+    shard count; the others are ``path.1`` ... ``path.<shards - 1>``.
+    """
+
+    def __init__(self, path, hold_seconds=15 * 60, shards=8):
+        super().__init__(hold_seconds)
+        self.path = path
+        self.paths = [path] + [f"{path}.{i}" for i in range(1, shards)]
+        self._locks = [threading.Lock() for _ in self.paths]
+        self._local = threading.local()
+        meta = self._conn(0)
+        meta.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        meta.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+        created_with = int(meta.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()[0])
+        if created_with != shards:
+            raise ValueError(f"{path} was created with {created_with} shards, not {shards}")
+        for i in range(shards):
+            conn = self._conn(i)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stock ("
+                " sku TEXT PRIMARY KEY,"
+                " on_hand INTEGER NOT NULL,"
+                " reserved INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reservations ("
+                " phone TEXT NOT NULL,"
+                " sku TEXT NOT NULL,"
+                " quantity INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (phone, sku))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS reservations_expires_at ON reservations (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sales ("
+                " order_id TEXT NOT NULL,"
+                " sku TEXT NOT NULL,"
+                " quantity INTEGER NOT NULL,"
+                " sold_at REAL NOT NULL,"
+                " PRIMARY KEY (order_id, sku))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sales_sold_at ON sales (sold_at)")
+
+    def _conn(self, shard):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = [None] * len(self.paths)
+        if conns[shard] is None:
+            conn = connect(self.paths[shard])
+            conns[shard] = conn
+        return conns[shard]
+
+    def _shard(self, sku):
+        return zlib.crc32(sku.encode()) % len(self.paths)
+
+    @contextmanager
+    def _transaction(self, shards):
+        """``BEGIN IMMEDIATE`` on each shard, taken in index order so callers can't deadlock."""
+        locked, conns = [], {}
+        try:
+            for i in sorted(set(shards)):
+                self._locks[i].acquire()
+                locked.append(i)
+                conns[i] = self._conn(i)
+                conns[i].execute("BEGIN IMMEDIATE")
+            yield conns
+        except BaseException:
+            for conn in conns.values():
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            raise
+        else:
+            for conn in conns.values():
+                conn.execute("COMMIT")
+        finally:
+            for i in locked:
+                self._locks[i].release()
+
+    def _held_shards(self, phone):
+        return [
+            i for i in range(len(self.paths))
+            if self._conn(i).execute("SELECT 1 FROM reservations WHERE phone = ? LIMIT 1", (phone,)).fetchone()
+        ]
+
+    @staticmethod
+    def _return_holds(conn, phone):
+        rows = conn.execute("SELECT sku, quantity FROM reservations WHERE phone = ?", (phone,)).fetchall()
+        conn.execute("DELETE FROM reservations WHERE phone = ?", (phone,))
+        conn.executemany("UPDATE stock SET reserved = reserved - ? WHERE sku = ?",
+                         [(quantity, sku) for sku, quantity in rows])
+        return rows
+
+    def set_stock(self, sku, available):
+        i = self._shard(sku)
+        with self._transaction([i]) as conns:
+            conns[i].execute(
+                "INSERT INTO stock (sku, on_hand) VALUES (?, ?) "
+                "ON CONFLICT (sku) DO UPDATE SET on_hand = excluded.on_hand + stock.reserved",
+                (sku, available),
+            )
+
+    def add_stock(self, sku, quantity):
+        i = self._shard(sku)
+        with self._transaction([i]) as conns:
+            conns[i].execute(
+                "INSERT INTO stock (sku, on_hand) VALUES (?, ?) "
+                "ON CONFLICT (sku) DO UPDATE SET on_hand = stock.on_hand + excluded.on_hand",
+                (sku, quantity),
+            )
+
+    def available(self, sku):
+        row = self._conn(self._shard(sku)).execute(
+            "SELECT on_hand - reserved FROM stock WHERE sku = ?", (sku,)
+        ).fetchone()
+        return None if row is None else max(row[0], 0)
+
+    def reserve(self, phone, sku, quantity):
+        if self.available(sku) is None:
+            return True
+        i = self._shard(sku)
+        with self._transaction([i]) as conns:
+            conn = conns[i]
+            cur = conn.execute(
+                "UPDATE stock SET reserved = reserved + ? WHERE sku = ? AND on_hand - reserved >= ?",
+                (quantity, sku, quantity),
+            )
+            if cur.rowcount == 0:
+                return False
+            expires_at = time.time() + self.hold_seconds
+            conn.execute(
+                "INSERT INTO reservations (phone, sku, quantity, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (phone, sku) DO UPDATE SET quantity = quantity + excluded.quantity",
+                (phone, sku, quantity, expires_at),
+            )
+            # Refreshes the cart's holds in this shard; holds in other shards keep
+            # their own expiry and are topped up at checkout if they lapse.
+            conn.execute("UPDATE reservations SET expires_at = ? WHERE phone = ?", (expires_at, phone))
+        return True
+
+    def release(self, phone, sku, quantity=None):
+        i = self._shard(sku)
+        query = "SELECT quantity FROM reservations WHERE phone = ? AND sku = ?"
+        if self._conn(i).execute(query, (phone, sku)).fetchone() is None:
+            return 0
+        with self._transaction([i]) as conns:
+            conn = conns[i]
+            row = conn.execute(query, (phone, sku)).fetchone()
+            if row is None:
+                return 0
+            held = row[0]
+            released = held if quantity is None else min(quantity, held)
+            if released == held:
+                conn.execute("DELETE FROM reservations WHERE phone = ? AND sku = ?", (phone, sku))
+            else:
+                conn.execute(
+                    "UPDATE reservations SET quantity = quantity - ? WHERE phone = ? AND sku = ?",
+                    (released, phone, sku),
+                )
+            conn.execute("UPDATE stock SET reserved = reserved - ? WHERE sku = ?", (released, sku))
+        return released
+
+    def release_all(self, phone):
+        shards = self._held_shards(phone)
+        if not shards:
+            return {}
+        released = {}
+        with self._transaction(shards) as conns:
+            for conn in conns.values():
+                released.update(self._return_holds(conn, phone))
+        return released
+
+    def commit(self, phone, cart, order_id):
+        tracked = {sku: quantity for sku, quantity in cart.items() if self.available(sku) is not None}
+        shards = {self._shard(sku) for sku in tracked} | set(self._held_shards(phone))
+        if not shards:
+            return []
+        # Only the shards this cart touches are locked, and each records the
+        # order's lines in the same transaction as the sale. A crash between
+        # the per-shard COMMITs leaves part of the cart sold; retrying the
+        # order skips the shards that already have it and sells the rest.
+        try:
+            with self._transaction(shards) as conns:
+                done = {
+                    i for i, conn in conns.items()
+                    if conn.execute("SELECT 1 FROM sales WHERE order_id = ? LIMIT 1", (order_id,)).fetchone()
+                }
+                # Return the hold, then sell each item from free stock; a
+                # shortfall rolls every shard back to exactly the state before.
+                for conn in conns.values():
+                    self._return_holds(conn, phone)
+                shortages = []
+                now = time.time()
+                for sku, quantity in tracked.items():
+                    i = self._shard(sku)
+                    if i in done:
+                        continue
+                    conn = conns[i]
+                    cur = conn.execute(
+                        "UPDATE stock SET on_hand = on_hand - ? WHERE sku = ? AND on_hand - reserved >= ?",
+                        (quantity, sku, quantity),
+                    )
+                    if cur.rowcount == 0:
+                        row = conn.execute("SELECT on_hand - reserved FROM stock WHERE sku = ?", (sku,)).fetchone()
+                        shortages.append((sku, max(row[0], 0)))
+                    else:
+                        conn.execute(
+                            "INSERT INTO sales (order_id, sku, quantity, sold_at) VALUES (?, ?, ?, ?)",
+                            (order_id, sku, quantity, now),
+                        )
+                if shortages:
+                    raise _Shortage(shortages)
+        except _Shortage as e:
+            return e.shortages
+        return []
+
+    def release_expired(self):
+        released = 0
+        now = time.time()
+        for i in range(len(self.paths)):
+            forgotten = now - ORDER_RETENTION_SECONDS
+            if self._conn(i).execute("SELECT 1 FROM sales WHERE sold_at < ? LIMIT 1", (forgotten,)).fetchone():
+                with self._transaction([i]) as conns:
+                    conns[i].execute("DELETE FROM sales WHERE sold_at < ?", (forgotten,))
+            if self._conn(i).execute("SELECT 1 FROM reservations WHERE expires_at < ? LIMIT 1", (now,)).fetchone() is None:
+                continue
+            with self._transaction([i]) as conns:
+                conn = conns[i]
+                rows = conn.execute(
+                    "SELECT sku, quantity FROM reservations WHERE expires_at < ?", (now,)
+                ).fetchall()
+                conn.execute("DELETE FROM reservations WHERE expires_at < ?", (now,))
+                conn.executemany("UPDATE stock SET reserved = reserved - ? WHERE sku = ?",
+                                 [(quantity, sku) for sku, quantity in rows])
+            released += len(rows)
+        return released
+
+    def levels(self):
+        levels = {}
+        for i in range(len(self.paths)):
+            levels.update(self._conn(i).execute("SELECT sku, MAX(on_hand - reserved, 0) FROM stock"))
+        return dict(sorted(levels.items()))
+
+
+# -------------------- Redis backend --------------------
+class RedisInventory(Inventory):
+    """Stock in Redis for workers on several hosts.
+
+    ``stock:<sku>`` counts free units and is only changed with DECRBY and
+    INCRBY, which Redis applies atomically per key: a reservation takes its
+    units first and puts them back if the counter went negative, so hot
+    SKUs never wait on a lock or retry a transaction. Each phone's hold is
+    a JSON record updated with WATCH/MULTI/EXEC.
+    """
+
+    def __init__(self, url, prefix="shopease:", hold_seconds=15 * 60):
+        super().__init__(hold_seconds)
+        self.client = RespClient(url)
+        self.prefix = prefix
+        self._skus = prefix + "stock_skus"
+        self._holds = prefix + "holds"
+
+    def _stock(self, sku):
+        return f"{self.prefix}stock:{sku}"
+
+    def _hold(self, phone):
+        return f"{self.prefix}hold:{phone}"
+
+    def _order(self, order_id):
+        return f"{self.prefix}order:{order_id}"
+
+    def _tracked(self, sku):
+        return self.client.execute("EXISTS", self._stock(sku)) == 1
+
+    def _take(self, sku, quantity):
+        left = self.client.execute("DECRBY", self._stock(sku), quantity)
+        if left < 0:
+            self.client.execute("INCRBY", self._stock(sku), quantity)
+            return False
+        return True
+
+    def _give_back(self, items):
+        if items:
+            self.client.pipeline(*[("INCRBY", self._stock(sku), n) for sku, n in items.items() if n > 0])
+
+    def _swap_hold(self, phone, change):
+        """Apply ``change(items, expires_at) -> (items, expires_at, result)`` to the hold atomically."""
+        conn = self.client.connection()
+        key = self._hold(phone)
+        while True:
+            conn.execute("WATCH", key)
+            data = conn.execute("GET", key)
+            hold = json.loads(data) if data else {"items": {}, "expires_at": 0}
+            items, expires_at, result = change(dict(hold["items"]), hold["expires_at"])
+            if not data and not items:
+                # No hold before or after: skip the write.
+                conn.execute("UNWATCH")
+                return result
+            if items:
+                commands = [("SET", key, json.dumps({"items": items, "expires_at": expires_at})),
+                            ("ZADD", self._holds, expires_at, phone)]
+            else:
+                commands = [("DEL", key), ("ZREM", self._holds, phone)]
+            if conn.pipeline(("MULTI",), *commands, ("EXEC",))[-1] is not None:
+                return result
+
+    def set_stock(self, sku, available):
+        self.client.pipeline(("SET", self._stock(sku), available), ("ZADD", self._skus, 0, sku))
+
+    def add_stock(self, sku, quantity):
+        self.client.pipeline(("INCRBY", self._stock(sku), quantity), ("ZADD", self._skus, 0, sku))
+
+    def available(self, sku):
+        value = self.client.execute("GET", self._stock(sku))
+        return None if value is None else max(int(value), 0)
+
+    def reserve(self, phone, sku, quantity):
+        if not self._tracked(sku):
+            return True
+        if not self._take(sku, quantity):
+            return False
+
+        def add(items, expires_at):
+            items[sku] = items.get(sku, 0) + quantity
+            return items, time.time() + self.hold_seconds, None
+
+        self._swap_hold(phone, add)
+        return True
+
+    def release(self, phone, sku, quantity=None):
+        def remove(items, expires_at):
+            held = items.get(sku, 0)
+            released = held if quantity is None else min(quantity, held)
+            if released == held:
+                items.pop(sku, None)
+            else:
+                items[sku] = held - released
+            return items, expires_at, released
+
+        released = self._swap_hold(phone, remove)
+        self._give_back({sku: released})
+        return released
+
+    def release_all(self, phone):
+        items = self._swap_hold(phone, lambda items, expires_at: ({}, 0, items))
+        self._give_back(items)
+        return items
+
+    def commit(self, phone, cart, order_id):
+        # A retried order finds its marker and sells nothing more; the marker
+        # is dropped again if the cart falls short.
+        marker = self._order(order_id)
+        if self.client.execute("SET", marker, phone, "NX", "EX", ORDER_RETENTION_SECONDS) is None:
+            return []
+        # Claim the whole hold first so an expiry sweep can't return it twice.
+        held = self._swap_hold(phone, lambda items, expires_at: ({}, 0, (items, expires_at)))
+        items, expires_at = held
+        taken, shortages = {}, []
+        for sku, quantity in cart.items():
+            need = quantity - items.get(sku, 0)
+            if need <= 0 or not self._tracked(sku):
+                continue
+            if self._take(sku, need):
+                taken[sku] = need
+            else:
+                shortages.append((sku, items.get(sku, 0) + (self.available(sku) or 0)))
+        if shortages:
+            self._give_back(taken)
+            self._swap_hold(phone, lambda current, _: ({**items, **current}, expires_at or time.time(), None))
+            self.client.execute("DEL", marker)
+            return shortages
+        self._give_back({sku: n - cart.get(sku, 0) for sku, n in items.items()})
+        return []
+
+    def release_expired(self):
+        now = time.time()
+        released = 0
+        for phone in self.client.execute("ZRANGEBYSCORE", self._holds, "-inf", f"({now}"):
+            # The customer may have added something since: re-check under WATCH.
+            def expire(items, expires_at):
+                if expires_at >= now:
+                    return items, expires_at, {}
+                return {}, 0, items
+
+            items = self._swap_hold(phone, expire)
+            self._give_back(items)
+            released += len(items)
+        return released
+
+    def levels(self):
+        skus = self.client.execute("ZRANGE", self._skus, 0, -1)
+        if not skus:
+            return {}
+        values = self.client.execute("MGET", *map(self._stock, skus))
+        return {sku: max(int(v), 0) for sku, v in zip(skus, values) if v is not None}
+
+
+def open_inventory(url, hold_seconds=15 * 60, shards=8):
+    """``shards`` applies to SQLite only and must match the one the files were created with."""
+    if url.startswith("sqlite:///"):
+        return SQLiteInventory(url[len("sqlite:///"):], hold_seconds=hold_seconds, shards=shards)
+    if url.startswith("redis://"):
+        return RedisInventory(url, hold_seconds=hold_seconds)
+    raise ValueError(f"Unsupported inventory URL: {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and change stock levels.")
+    parser.add_argument("--url", default=os.getenv("INVENTORY_URL", "sqlite:///inventory.db"))
+    parser.add_argument("--shards", type=int, default=int(os.getenv("INVENTORY_SHARDS", "8")))
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("set", "set the units free to sell"), ("add", "add units (restock)")):
+        cmd = commands.add_parser(name, help=help)
+        cmd.add_argument("sku")
+        cmd.add_argument("quantity", type=int)
+    load = commands.add_parser("load", help="set stock from the 'stock' field of a JSONL catalog")
+    load.add_argument("path")
+    commands.add_parser("show", help="print free units per SKU")
+    args = parser.parse_args()
+
+    inventory = open_inventory(args.url, shards=args.shards)
+    if args.command == "set":
+        inventory.set_stock(args.sku, args.quantity)
+    elif args.command == "add":
+        inventory.add_stock(args.sku, args.quantity)
+    elif args.command == "load":
+        loaded = 0
+        with open(args.path) as f:
+            for line in f:
+                if line.strip():
+                    product = json.loads(line)
+                    if "stock" in product:
+                        inventory.set_stock(str(product["id"]), int(product["stock"]))
+                        loaded += 1
+        print(f"Set stock for {loaded} products.")
+    for sku, available in inventory.levels().items():
+        print(f"{sku}\t{available}")
+
+
+if __name__ == "__main__":
+    main()
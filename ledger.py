@@ -0,0 +1,166 @@
+# ledger.py
+# Local append-only record of completed orders, with the names and prices
+# captured at checkout. Also a CLI for reports that stream over the ledger:
+#
+#   python ledger.py revenue [--since 2026-01-01] [--until 2026-12-31] > revenue.csv
+#   python ledger.py history 919876543210
+import argparse
+import csv
+import os
+import sys
+import threading
+import time
+
+from db import connect
+
+
+class OrderLedger:
+    """Orders are only ever inserted, never updated.
+
+    ``orders`` is indexed by ``(phone, created_at)`` for history and reorder;
+    ``order_items`` carries the order's day and is indexed by it, so daily
+    reports read the items in day order straight off the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " order_id TEXT PRIMARY KEY,"
+            " phone TEXT NOT NULL,"
+            " created_at INTEGER NOT NULL,"
+            " day TEXT NOT NULL,"
+            " item_count INTEGER NOT NULL,"
+            " grand_total INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS orders_phone ON orders (phone, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS order_items ("
+            " order_id TEXT NOT NULL,"
+            " day TEXT NOT NULL,"
+            " product_id TEXT NOT NULL,"
+            " product_name TEXT NOT NULL,"
+            " quantity INTEGER NOT NULL,"
+            " price INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS order_items_day ON order_items (day, product_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS order_items_order ON order_items (order_id)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def record(self, order):
+        """Append an order built by ``n8n_export.build_order``; repeats of an order id are ignored."""
+        day = order["timestamp"][:10]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO orders (order_id, phone, created_at, day, item_count, grand_total) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (order["order_id"], order["phone"], int(time.time()), day,
+                 order["item_count"], order["grand_total"]),
+            )
+            if cur.rowcount == 1:
+                conn.executemany(
+                    "INSERT INTO order_items (order_id, day, product_id, product_name, quantity, price) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(order["order_id"], day, item["product_id"], item["product_name"],
+                      item["quantity"], item["price"]) for item in order["items"]],
+                )
+
+    def history(self, phone, limit=5):
+        """Most recent orders first, each with its items as snapshotted at checkout."""
+        conn = self._conn()
+        orders = conn.execute(
+            "SELECT order_id, created_at, day, item_count, grand_total FROM orders "
+            "WHERE phone = ? ORDER BY created_at DESC, rowid DESC LIMIT ?",
+            (phone, limit),
+        ).fetchall()
+        result = []
+        for order_id, created_at, day, item_count, grand_total in orders:
+            items = conn.execute(
+                "SELECT product_id, product_name, quantity, price FROM order_items WHERE order_id = ? ORDER BY rowid",
+                (order_id,),
+            ).fetchall()
+            result.append({
+                "order_id": order_id,
+                "created_at": created_at,
+                "day": day,
+                "item_count": item_count,
+                "grand_total": grand_total,
+                "items": [
+                    {"product_id": pid, "product_name": name, "quantity": qty, "price": price}
+                    for pid, name, qty, price in items
+                ],
+            })
+        return result
+
+    def last_order(self, phone):
+        orders = self.history(phone, limit=1)
+        return orders[0] if orders else None
+
+    def revenue_by_day(self, since=None, until=None):
+        """Yield ``(day, product_id, product_name, quantity, revenue)`` in day order.
+
+        Items are streamed off the ``(day, product_id)`` index and totalled one
+        day at a time, so memory stays at one day's products however long the
+        ledger is.
+        """
+        cursor = self._conn().execute(
+            "SELECT day, product_id, product_name, quantity, price FROM order_items "
+            "WHERE day >= ? AND day <= ? ORDER BY day, product_id",
+            (since or "", until or "9999-99-99"),
+        )
+        current, totals = None, {}
+        for day, pid, name, qty, price in cursor:
+            if day != current:
+                yield from _day_rows(current, totals)
+                current, totals = day, {}
+            entry = totals.get(pid)
+            if entry is None:
+                entry = totals[pid] = [name, 0, 0]
+            entry[1] += qty
+            entry[2] += qty * price
+        yield from _day_rows(current, totals)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+
+def _day_rows(day, totals):
+    for pid, (name, qty, revenue) in totals.items():
+        yield day, pid, name, qty, revenue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports over the local order ledger.")
+    parser.add_argument("--db", default=os.getenv("ORDER_LEDGER_PATH", "orders.db"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    revenue = commands.add_parser("revenue", help="CSV of quantity and revenue per product per day")
+    revenue.add_argument("--since", help="first day, YYYY-MM-DD")
+    revenue.add_argument("--until", help="last day, YYYY-MM-DD")
+    history = commands.add_parser("history", help="a customer's recent orders")
+    history.add_argument("phone")
+    history.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    ledger = OrderLedger(args.db)
+    if args.command == "revenue":
+        out = csv.writer(sys.stdout)
+        out.writerow(["day", "product_id", "product_name", "quantity", "revenue"])
+        out.writerows(ledger.revenue_by_day(args.since, args.until))
+    else:
+        for order in ledger.history(args.phone, args.limit):
+            items = ", ".join(f"{i['quantity']} × {i['product_name']} @ ₹{i['price']}" for i in order["items"])
+            print(f"{order['day']}  {order['order_id']}  ₹{order['grand_total']}  {items}")
+
+
+if __name__ == "__main__":
+    main()
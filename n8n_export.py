@@ -0,0 +1,201 @@
+# n8n_export.py
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connect
+from outbound import OUTBOUND_RESPONSES, OUTBOUND_SECONDS, pooled_session
+
+
+def build_order(phone, cart, products, stage="Completed", order_id=None):
+    """One order document per checkout, with totals computed in a single pass."""
+    items = []
+    grand_total = 0
+    for pid, qty in cart.items():
+        product = products.get(pid, {})
+        price = product.get("price", 0)
+        items.append({
+            "product_id": pid,
+            "product_name": product.get("name", "Unknown"),
+            "quantity": qty,
+            "price": price,
+            "total_item": price * qty,
+        })
+        grand_total += price * qty
+    return {
+        "order_id": order_id or uuid.uuid4().hex,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "phone": phone,
+        "items": items,
+        "item_count": sum(qty for qty in cart.values()),
+        "grand_total": grand_total,
+        "stage": stage,
+    }
+
+
+# -------------------- Durable outbox --------------------
+class OrderOutbox:
+    """SQLite-backed queue of orders that have not reached n8n yet."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " order_id TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def add(self, order):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR IGNORE INTO outbox (order_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+            (order["order_id"], json.dumps(order), now, now),
+        )
+
+    def claim(self, limit, lease):
+        # Leasing pushes next_attempt_at forward, so a crashed delivery is retried
+        # after the lease expires instead of being lost.
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT order_id, payload, attempts FROM outbox WHERE next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE order_id = ?",
+                [(now + lease, r[0]) for r in rows],
+            )
+        return [(order_id, json.loads(payload), attempts) for order_id, payload, attempts in rows]
+
+    def remove(self, order_ids):
+        self._conn().executemany("DELETE FROM outbox WHERE order_id = ?", [(i,) for i in order_ids])
+
+    def retry_later(self, order_ids, delay):
+        self._conn().executemany(
+            "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE order_id = ?",
+            [(time.time() + delay, i) for i in order_ids],
+        )
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+# -------------------- Delivery worker --------------------
+class OrderExporter:
+    """Delivers outbox orders to n8n off the request path.
+
+    With ``batch_size`` > 1 several checkouts are coalesced into one
+    ``{"orders": [...]}`` post. Every post carries an ``Idempotency-Key``
+    derived from its order ids, and each order carries its ``order_id``,
+    so a retried delivery can be matched up instead of appended twice.
+    """
+
+    def __init__(self, url, outbox, concurrency=2, batch_size=1, batch_wait=0.0,
+                 timeout=10, backoff=2.0, max_backoff=300, session=None):
+        self.url = url
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = session or pooled_session(concurrency)
+        self.delivered = 0
+        self.failed_attempts = 0
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="n8n-export")
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="n8n-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, order):
+        self.outbox.add(order)
+        self._wake.set()
+        return order
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.outbox.count():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._wake.set()
+            time.sleep(0.02)
+        return True
+
+    def shutdown(self, timeout=10):
+        # Undelivered orders stay in the outbox and are picked up on next start.
+        drained = self.flush(timeout)
+        self._stopping = True
+        self._wake.set()
+        # The loop may be waiting for a slot held by a delivery in flight; let
+        # it see _stopping and exit before the pool refuses new work.
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+        return drained
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+            if self.batch_wait:
+                time.sleep(self.batch_wait)
+            while not self._stopping:
+                self._slots.acquire()
+                if self._stopping:
+                    self._slots.release()
+                    break
+                batch = self.outbox.claim(self.batch_size, lease=self.timeout * 3)
+                if not batch:
+                    self._slots.release()
+                    break
+                self._pool.submit(self._deliver, batch)
+
+    def _deliver(self, batch):
+        try:
+            order_ids = [order_id for order_id, _, _ in batch]
+            orders = [order for _, order, _ in batch]
+            if len(orders) == 1:
+                body, key = orders[0], order_ids[0]
+            else:
+                body = {"orders": orders}
+                key = hashlib.sha256(",".join(order_ids).encode()).hexdigest()
+            started = time.perf_counter()
+            try:
+                r = self.session.post(self.url, json=body, headers={"Idempotency-Key": key}, timeout=self.timeout)
+                OUTBOUND_RESPONSES.inc("n8n", str(r.status_code))
+                ok = r.status_code == 200
+                if not ok:
+                    print(f"n8n responded with {r.status_code}: {r.text}")
+            except Exception as e:
+                OUTBOUND_RESPONSES.inc("n8n", "error")
+                ok = False
+                print(f"Failed to send order data to n8n: {e}")
+            OUTBOUND_SECONDS.observe(time.perf_counter() - started, "n8n")
+            if ok:
+                self.outbox.remove(order_ids)
+                self.delivered += len(order_ids)
+                print(f"Sent {len(order_ids)} order(s) to n8n.")
+            else:
+                attempts = max(a for _, _, a in batch)
+                self.failed_attempts += 1
+                self.outbox.retry_later(order_ids, min(self.backoff * 2 ** attempts, self.max_backoff))
+        finally:
+            self._slots.release()
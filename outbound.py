@@ -0,0 +1,196 @@
+# outbound.py
+import email.utils
+import queue
+import random
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY
+from rendering import INTERACTIVE_BODY_LIMIT
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_TEXT_LENGTH = 4096  # WhatsApp text body limit
+MAX_RETRY_AFTER = 60.0  # seconds; longer server hints are capped
+
+OUTBOUND_SECONDS = REGISTRY.histogram(
+    "outbound_request_seconds", "Latency of outbound HTTP calls.", labels=("service",)
+)
+OUTBOUND_RESPONSES = REGISTRY.counter(
+    "outbound_responses_total", "Outbound HTTP calls by response status.", labels=("service", "status")
+)
+
+
+def split_text(text, limit=MAX_TEXT_LENGTH):
+    """Cut ``text`` into chunks of at most ``limit``, at line breaks or spaces where possible."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            chunks.append(text[:limit])
+            text = text[limit:]
+        else:
+            chunks.append(text[:cut])
+            text = text[cut + 1:]
+    chunks.append(text)
+    return chunks
+
+
+def coalesce(replies, limit=MAX_TEXT_LENGTH, separator="\n\n"):
+    """Join consecutive texts into as few bodies as fit in ``limit``, keeping their order.
+
+    Replies may also be interactive objects (dicts); the text just before one
+    is folded into its body when the result stays under the interactive limit.
+    """
+    bodies = []
+    for reply in replies:
+        if isinstance(reply, dict):
+            body = reply["body"]["text"]
+            if (bodies and isinstance(bodies[-1], str)
+                    and len(bodies[-1]) + len(separator) + len(body) <= INTERACTIVE_BODY_LIMIT):
+                reply = {**reply, "body": {"text": bodies.pop() + separator + body}}
+            bodies.append(reply)
+            continue
+        for chunk in split_text(reply, limit):
+            if bodies and isinstance(bodies[-1], str) and len(bodies[-1]) + len(separator) + len(chunk) <= limit:
+                bodies[-1] += separator + chunk
+            else:
+                bodies.append(chunk)
+    return bodies
+
+
+def retry_after(value, default, cap=MAX_RETRY_AFTER):
+    """Seconds to wait from a Retry-After header (delay or HTTP date), else ``default``."""
+    if value:
+        try:
+            seconds = float(value)
+            if seconds >= 0:  # also rejects nan
+                return min(seconds, cap)
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+            return min(max(when.timestamp() - time.time(), 0.0), cap)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return default
+
+
+def pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class OutboundDispatcher:
+    """Background sender for Graph API messages.
+
+    Phones are hashed onto a fixed set of worker queues, so messages to the
+    same phone keep their order while different phones are sent in parallel.
+    """
+
+    def __init__(self, url, headers, workers=8, max_retries=4, backoff=0.5, timeout=10, session=None,
+                 service="graph"):
+        self.url = url
+        self.service = service
+        self.headers = headers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or pooled_session(workers)
+        self.sent = 0
+        self.failed = 0
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"outbound-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, phone, payload, callback=None):
+        """Queue ``payload``; ``callback(ok)`` runs on the worker once it is sent or given up on."""
+        shard = zlib.crc32(phone.encode()) % len(self._queues)
+        self._queues[shard].put((payload, callback))
+
+    def pending(self):
+        return sum(q.unfinished_tasks for q in self._queues)
+
+    def flush(self, timeout=None):
+        """Block until every queued message has been sent or given up on."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=30):
+        drained = self.flush(timeout)
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.join(timeout=1)
+        self.session.close()
+        return drained
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                payload, callback = item
+                # Nothing raised for one message may stop the worker: the
+                # rest of its shard would stay queued forever.
+                try:
+                    ok = self.post(payload)
+                except Exception as e:
+                    print(f"Failed to send message: {e!r}")
+                    ok = False
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                if callback is not None:
+                    try:
+                        callback(ok)
+                    except Exception as e:
+                        print(f"Send callback failed: {e!r}")
+            finally:
+                q.task_done()
+
+    def post(self, payload):
+        resp = None
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(self.url, headers=self.headers, json=payload, timeout=self.timeout)
+                OUTBOUND_SECONDS.observe(time.perf_counter() - started, self.service)
+                OUTBOUND_RESPONSES.inc(self.service, str(resp.status_code))
+                if resp.status_code not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    return True
+                delay = retry_after(resp.headers.get("Retry-After"), self.backoff * 2 ** attempt)
+            except requests.HTTPError as e:
+                # 4xx other than 429 will not succeed on retry.
+                print(f"Failed to send message: {e}")
+                print("Response:", resp.text)
+                return False
+            except requests.RequestException as e:
+                OUTBOUND_SECONDS.observe(time.perf_counter() - started, self.service)
+                OUTBOUND_RESPONSES.inc(self.service, "error")
+                print(f"Send attempt {attempt + 1} failed: {e}")
+                delay = self.backoff * 2 ** attempt
+            if attempt < self.max_retries:
+                time.sleep(delay * (0.5 + random.random() / 2))
+        print(f"Failed to send message after {self.max_retries + 1} attempts.")
+        if resp is not None:
+            print("Response:", resp.text)
+        return False
@@ -0,0 +1,64 @@
+# profiler.py
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples thread stacks every ``interval`` seconds into folded stacks.
+
+    Only threads currently inside one of ``entry_points`` (function names)
+    are sampled, so idle pool threads don't drown out the request path.
+    ``folded()`` returns the ``frame;frame;frame count`` format read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, entry_points, interval=0.005):
+        self.entry_points = set(entry_points)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.folded()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                on_path = False
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+                    on_path = on_path or code.co_name in self.entry_points
+                    frame = frame.f_back
+                if on_path:
+                    self.stacks[";".join(reversed(stack))] += 1
+                    self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
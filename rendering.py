@@ -0,0 +1,226 @@
+# rendering.py
+# Message text builders. Static texts are built once at import; catalog
+# text is cached per catalog version; cart texts are built in one pass.
+import threading
+from collections import OrderedDict
+
+from conversation import ANY, reply_id
+
+
+UNKNOWN_PRODUCT = {"name": "Unknown", "price": 0}
+
+MAIN_MENU_TEXT = (
+    "*🛍️ Welcome to ShopEase!* 👋\n\n"
+    "Choose an option:\n\n"
+    "1️⃣ *Browse Our Collection*\n"
+    "2️⃣ *View Cart*\n"
+    "3️⃣ *Edit Cart*\n"
+    "4️⃣ *Proceed to Checkout*\n"
+    "5️⃣ *Customer Support*\n"
+    "6️⃣ *Help / Main Menu*\n"
+    "7️⃣ *Reorder Last Order*\n\n"
+    "Reply with the number or option name.\n(Type *menu* anytime to return here.)"
+)
+
+EMPTY_CART_TEXT = "🛒 Your cart is empty.\n\nType *1* to browse products or *menu* to see options."
+
+CATALOG_HEADER = "*🛒 Available Products:*\n\n"
+CATALOG_FOOTER = "\nReply with the *product number* to add it to your cart, or type *menu* to go back."
+
+PAGED_CATALOG_FOOTER = (
+    "\nReply with the *product number* to add it to your cart, *next* or *prev* to see more, "
+    "or type *menu* to go back."
+)
+
+SEARCH_FOOTER = "\nReply with the *product number* to add it to your cart, or type *menu* to go back."
+
+CART_FOOTER = "\n\nReply *checkout* to pay, *edit* to modify, or *menu* to return."
+MODIFY_FOOTER = "\nReply with the *product number* to update its quantity (0 to delete), or *menu* to return."
+
+
+# -------------------- Interactive messages --------------------
+INTERACTIVE_BODY_LIMIT = 1024
+MAX_BUTTONS = 3
+MAX_LIST_ROWS = 10
+LIST_PAGE_SIZE = MAX_LIST_ROWS - 2  # room for the prev/next rows
+QUERY_ECHO_LIMIT = 60  # characters of a customer's search repeated back to them
+
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def button_message(body, buttons):
+    """Reply-button message; ``buttons`` are ``(reply id, title)`` pairs."""
+    return {
+        "type": "button",
+        "body": {"text": _clip(body, INTERACTIVE_BODY_LIMIT)},
+        "action": {"buttons": [
+            {"type": "reply", "reply": {"id": rid, "title": _clip(title, 20)}}
+            for rid, title in buttons[:MAX_BUTTONS]
+        ]},
+    }
+
+
+def list_message(body, button, rows):
+    """Single-section list message; ``rows`` are ``(reply id, title, description)``."""
+    items = []
+    for rid, title, description in rows[:MAX_LIST_ROWS]:
+        row = {"id": rid, "title": _clip(title, 24)}
+        if description:
+            row["description"] = _clip(description, 72)
+        items.append(row)
+    return {
+        "type": "list",
+        "body": {"text": _clip(body, INTERACTIVE_BODY_LIMIT)},
+        "action": {"button": _clip(button, 20), "sections": [{"title": "ShopEase", "rows": items}]},
+    }
+
+
+def product_row(pid, product):
+    return reply_id("browsing", "product", pid), product["name"], f"#{pid} · ₹{product['price']}"
+
+
+MAIN_MENU_LIST = list_message(
+    "*🛍️ Welcome to ShopEase!* 👋\n\nChoose an option:",
+    "Options",
+    [
+        (reply_id(ANY, "browse"), "Browse Our Collection", ""),
+        (reply_id(ANY, "view_cart"), "View Cart", ""),
+        (reply_id(ANY, "edit_cart"), "Edit Cart", ""),
+        (reply_id(ANY, "checkout"), "Proceed to Checkout", ""),
+        (reply_id(ANY, "support"), "Customer Support", ""),
+        (reply_id(ANY, "reorder"), "Reorder Last Order", "Same items as your last order"),
+    ],
+)
+
+
+class CatalogRenderer:
+    """Caches rendered catalog pages until the catalog version changes."""
+
+    def __init__(self, products, version=0, max_pages=1024):
+        self.products = products
+        self.version = version
+        self.max_pages = max_pages
+        self._cache = OrderedDict()
+        # Request and batch-pool threads share the cache; LRU moves and
+        # evictions must not interleave.
+        self._mutex = threading.Lock()
+
+    def set_catalog(self, products, version):
+        self.products = products
+        self.version = version
+        self._cache = OrderedDict()
+
+    def invalidate(self):
+        self.set_catalog(self.products, self.version + 1)
+
+    def _cached(self, key, build):
+        with self._mutex:
+            text = self._cache.get(key)
+            if text is not None:
+                self._cache.move_to_end(key)
+                return text
+        # Built outside the lock, so a slow page doesn't hold up cache hits.
+        text = build()
+        with self._mutex:
+            self._cache[key] = text
+            if len(self._cache) > self.max_pages:
+                self._cache.popitem(last=False)
+        return text
+
+    def catalog_text(self):
+        def build():
+            lines = [f"{pid}. {p['name']} — ₹{p['price']}\n" for pid, p in self.products.items()]
+            return CATALOG_HEADER + "".join(lines) + CATALOG_FOOTER
+
+        return self._cached((self.version, "all"), build)
+
+    def catalog_page(self, page, page_size):
+        pages = self.products.page_count(page_size)
+        page = min(max(page, 0), pages - 1)
+
+        def build():
+            lines = [f"{pid}. {p['name']} — ₹{p['price']}\n" for pid, p in self.products.page(page, page_size)]
+            if pages == 1:
+                return CATALOG_HEADER + "".join(lines) + CATALOG_FOOTER
+            header = f"*🛒 Available Products* (page {page + 1}/{pages}):\n\n"
+            return header + "".join(lines) + PAGED_CATALOG_FOOTER
+
+        return self._cached((self.version, page, page_size), build)
+
+    def catalog_list(self, page, page_size=LIST_PAGE_SIZE):
+        pages = self.products.page_count(page_size)
+        page = min(max(page, 0), pages - 1)
+
+        def build():
+            rows = [product_row(pid, p) for pid, p in self.products.page(page, page_size)]
+            if page > 0:
+                rows.append((reply_id("browsing", "prev_page"), "⬅️ Previous page", f"Page {page} of {pages}"))
+            if page < pages - 1:
+                rows.append((reply_id("browsing", "next_page"), "➡️ Next page", f"Page {page + 2} of {pages}"))
+            if pages == 1:
+                body = "*🛒 Available Products:*\n\nPick a product to add it to your cart."
+            else:
+                body = f"*🛒 Available Products* (page {page + 1}/{pages})\n\nPick a product to add it to your cart."
+            return list_message(body, "View products", rows)
+
+        return self._cached((self.version, "list", page, page_size), build)
+
+
+def search_results_text(query, results, products):
+    if not results:
+        return f"🔎 No products match “{_clip(query, QUERY_ECHO_LIMIT)}”. Try another word, or type *1* to browse the catalog."
+    lines = [f"*🔎 Results for “{_clip(query, QUERY_ECHO_LIMIT)}”:*\n\n"]
+    for pid in results:
+        p = products[pid]
+        lines.append(f"{pid}. {p['name']} — ₹{p['price']}\n")
+    lines.append(SEARCH_FOOTER)
+    return "".join(lines)
+
+
+def search_results_list(query, results, products):
+    rows = [product_row(pid, products[pid]) for pid in results]
+    return list_message(f"*🔎 Results for “{_clip(query, QUERY_ECHO_LIMIT)}”:*\n\nPick a product to add it to your cart.", "View results", rows)
+
+
+def cart_totals(cart, products):
+    count = 0
+    total = 0
+    for pid, qty in cart.items():
+        total += products.get(pid, UNKNOWN_PRODUCT)["price"] * qty
+        count += qty
+    return count, total
+
+
+def cart_summary_text(cart, products):
+    if not cart:
+        return EMPTY_CART_TEXT
+    lines = ["*🧺 Your Cart:*\n"]
+    count = 0
+    total = 0
+    for pid, qty in cart.items():
+        p = products.get(pid, UNKNOWN_PRODUCT)
+        line_total = p["price"] * qty
+        lines.append(f"- {p['name']} × {qty} = ₹{line_total}\n")
+        total += line_total
+        count += qty
+    lines.append(f"\n*Items:* {count}\n*Total:* ₹{total}")
+    lines.append(CART_FOOTER)
+    return "".join(lines)
+
+
+def modify_cart_text(cart, products):
+    lines = ["*✏️ Modify Cart:*\n"]
+    for pid, qty in cart.items():
+        lines.append(f"{pid}. {products.get(pid, UNKNOWN_PRODUCT)['name']} × {qty}\n")
+    lines.append(MODIFY_FOOTER)
+    return "".join(lines)
+
+
+def modify_cart_list(cart, products):
+    rows = [
+        (reply_id("modifying", "cart_item", pid), products.get(pid, UNKNOWN_PRODUCT)["name"], f"#{pid} · × {qty}")
+        for pid, qty in cart.items()
+    ]
+    return list_message("*✏️ Edit Cart*\n\nPick an item to change its quantity.", "Cart items", rows)
@@ -0,0 +1,108 @@
+# resp.py
+# Minimal client for the Redis protocol (RESP2), enough for the shared
+# session store. Speaks to Redis, Valkey, KeyDB or fake_services.FakeRedis.
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Error reply from the server."""
+
+
+class RespConnection:
+    def __init__(self, host, port, db=0, password=None, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    def send(self, *commands):
+        buf = bytearray()
+        for args in commands:
+            buf += b"*%d\r\n" % len(args)
+            for arg in args:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode()
+                buf += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        self.sock.sendall(buf)
+
+    def read(self):
+        # Error replies are returned, not raised, so a pipeline can still
+        # read the replies that follow them.
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self._file.read(n + 2)[:-2].decode()
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self.read() for _ in range(n)]
+        raise RespError(f"Unexpected reply {line!r}")
+
+    def execute(self, *args):
+        self.send(args)
+        reply = self.read()
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, *commands):
+        """Send several commands in one round trip; returns every reply."""
+        self.send(*commands)
+        return [self.read() for _ in commands]
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+
+class RespClient:
+    """One connection per thread to the server named by a ``redis://`` URL."""
+
+    def __init__(self, url, timeout=10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, method, *args):
+        try:
+            return getattr(self.connection(), method)(*args)
+        except OSError:
+            # Drop the broken socket; the next call reconnects.
+            self.close()
+            raise
+
+    def execute(self, *args):
+        return self._call("execute", *args)
+
+    def pipeline(self, *commands):
+        return self._call("pipeline", *commands)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
@@ -0,0 +1,176 @@
+# search.py
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+MAX_EXPANSIONS = 8
+MIN_TRIGRAM_SIMILARITY = 0.4
+# Trigrams shared by more tokens than this (e.g. "sku") say little about a typo.
+MAX_GRAM_POSTINGS = 1000
+# Ranks covered by the first window of a multi-token match; doubles after each.
+FIRST_WINDOW = 256
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Inverted index over product names with prefix and trigram fallbacks.
+
+    Products are numbered by rank (shorter names first), and posting lists
+    hold sorted ranks, so the best matches for a term are simply the head of
+    its list. A query token is matched exactly, then as a prefix of indexed
+    tokens (``"head"`` -> ``"headphones"``), then by trigram similarity
+    (``"headfones"``). Products matching every query token come first; the
+    most common tokens are then dropped one by one to fill the result list.
+    """
+
+    def __init__(self, products):
+        products = sorted(products, key=lambda item: (len(item[1]["name"]), item[0]))
+        self.pids = [pid for pid, _ in products]
+        postings = defaultdict(list)
+        for rank, (_, p) in enumerate(products):
+            for token in dict.fromkeys(tokenize(p["name"])):
+                postings[token].append(rank)
+        self.postings = dict(postings)
+        self.vocab = sorted(self.postings)
+        grams = defaultdict(list)
+        for token in self.vocab:
+            for g in trigrams(token):
+                grams[g].append(token)
+        self.grams = {g: tokens for g, tokens in grams.items() if len(tokens) <= MAX_GRAM_POSTINGS}
+
+    def expand(self, token):
+        if token in self.postings:
+            return [token]
+        i = bisect.bisect_left(self.vocab, token)
+        prefixed = []
+        while i < len(self.vocab) and self.vocab[i].startswith(token) and len(prefixed) < MAX_EXPANSIONS:
+            prefixed.append(self.vocab[i])
+            i += 1
+        if prefixed:
+            return prefixed
+        query_grams = trigrams(token)
+        overlap = Counter(chain.from_iterable(self.grams.get(g, ()) for g in query_grams))
+        scored = []
+        for candidate, shared in overlap.items():
+            similarity = shared / (len(query_grams) + len(candidate) + 1 - shared)
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                scored.append((similarity, candidate))
+        return [candidate for _, candidate in heapq.nlargest(MAX_EXPANSIONS, scored)]
+
+    def _matching(self, groups, limit, seen):
+        """Up to ``limit`` new ranks matching every group, best first.
+
+        Also returns how many leading groups matched together anywhere: when
+        the result is short, relaxing to fewer groups than that finds nothing new.
+        """
+        if len(groups) == 1:
+            terms = groups[0]
+            ranks = heapq.merge(*(self.postings[t] for t in terms)) if len(terms) > 1 else self.postings[terms[0]]
+            found = []
+            for rank in ranks:
+                if rank not in seen:
+                    seen.add(rank)
+                    found.append(rank)
+                    if len(found) >= limit:
+                        break
+            return found, 1
+        # Walk rank space in windows that double in size, led by the rarest
+        # group: bisect each sorted posting list to the window, intersect
+        # just those slices, and stop once ``limit`` ranks (the best ones)
+        # are found. Work grows with how far the matches are, not with the
+        # full posting lists.
+        lists = [[self.postings[t] for t in terms] for terms in groups]
+        lo = min(ranks[0] for ranks in lists[0])
+        end = max(ranks[-1] for ranks in lists[0]) + 1
+        width = FIRST_WINDOW
+        found = []
+        reached = 1
+        while lo < end and len(found) < limit:
+            hi = lo + width
+            candidates = set()
+            for ranks in lists[0]:
+                candidates.update(ranks[bisect.bisect_left(ranks, lo):bisect.bisect_left(ranks, hi)])
+            depth = 1
+            for group in lists[1:]:
+                if not candidates:
+                    break
+                candidates = set().union(*(
+                    candidates.intersection(ranks[bisect.bisect_left(ranks, lo):bisect.bisect_left(ranks, hi)])
+                    for ranks in group
+                ))
+                depth += bool(candidates)
+            reached = max(reached, depth)
+            if candidates:
+                for rank in sorted(candidates - seen)[:limit - len(found)]:
+                    seen.add(rank)
+                    found.append(rank)
+            lo, width = hi, width * 2
+        return found, reached
+
+    def search(self, query, limit=10):
+        groups = [terms for terms in map(self.expand, dict.fromkeys(tokenize(query))) if terms]
+        # Rarest tokens first, so relaxing the query drops the least specific ones.
+        groups.sort(key=lambda terms: sum(len(self.postings[t]) for t in terms))
+        found = []
+        seen = set()
+        keep = len(groups)
+        while keep:
+            more, reached = self._matching(groups[:keep], limit - len(found), seen)
+            found += more
+            if len(found) >= limit:
+                break
+            keep = min(keep - 1, reached)
+        return [self.pids[rank] for rank in found]
+
+
+class ProductSearch:
+    """Keeps a SearchIndex in step with a Catalog's version.
+
+    Only the very first index is built on the caller's thread. After a
+    catalog reload the old index keeps serving (hits for removed products
+    are filtered out) while ``refresh`` rebuilds on a background thread.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        index = self._index
+        if index is None:
+            self.warm()
+            return self._index
+        if self._version != self.catalog.version:
+            self.refresh()
+        return index
+
+    def warm(self):
+        """Build the index for the catalog's current version, blocking until done."""
+        with self._lock:
+            version = self.catalog.version
+            if self._version != version:
+                self._index = SearchIndex((p["id"], p) for p in self.catalog.records())
+                self._version = version
+
+    def refresh(self):
+        """Start a background rebuild if the catalog has moved on and none is running."""
+        if self._version != self.catalog.version and not self._lock.locked():
+            threading.Thread(target=self.warm, name="search-rebuild", daemon=True).start()
+
+    def search(self, query, limit=10):
+        return [pid for pid in self.index().search(query, limit) if pid in self.catalog]
@@ -0,0 +1,459 @@
+# session_store.py
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from db import connect
+from resp import RespClient, RespError
+
+
+def encode_session(session):
+    return json.dumps(session, separators=(",", ":"))
+
+
+# -------------------- Per-user locking --------------------
+class KeyedLocks:
+    """Fixed pool of locks striped by key hash; memory stays bounded."""
+
+    def __init__(self, stripes=1024):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def get(self, key):
+        return self._locks[zlib.crc32(key.encode()) % len(self._locks)]
+
+
+# -------------------- Store interface --------------------
+class SessionStore(ABC):
+    """Dict-like per-user session store; writes touch only one record.
+
+    ``lock(phone)`` serializes read-modify-write cycles for one user while
+    other users proceed in parallel.
+    """
+
+    def __init__(self):
+        self._key_locks = KeyedLocks()
+
+    @contextmanager
+    def lock(self, phone, timeout=30):
+        lock = self._key_locks.get(phone)
+        if not lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Timed out waiting for session lock on {phone}")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    # Backends store sessions as encoded JSON strings.
+    @abstractmethod
+    def get_raw(self, phone):
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_raw(self, phone, data):
+        raise NotImplementedError
+
+    def get(self, phone, default=None):
+        data = self.get_raw(phone)
+        return default if data is None else json.loads(data)
+
+    def put(self, phone, session):
+        self.put_raw(phone, encode_session(session))
+
+    def put_many(self, items):
+        for phone, session in items:
+            self.put(phone, session)
+
+    @abstractmethod
+    def delete(self, phone):
+        raise NotImplementedError
+
+    @abstractmethod
+    def items(self):
+        raise NotImplementedError
+
+    def idle_since(self, cutoff):
+        """Yield ``(phone, session)`` for sessions last written before ``cutoff``."""
+        for phone, session in self.items():
+            if session.get("last_seen", 0) < cutoff:
+                yield phone, session
+
+    @abstractmethod
+    def count(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __getitem__(self, phone):
+        session = self.get(phone)
+        if session is None:
+            raise KeyError(phone)
+        return session
+
+    def __setitem__(self, phone, session):
+        self.put(phone, session)
+
+    def __delitem__(self, phone):
+        self.delete(phone)
+
+    def __contains__(self, phone):
+        return self.get(phone) is not None
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for phone, _ in self.items():
+            yield phone
+
+
+# -------------------- SQLite (WAL) backend --------------------
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path, lease_seconds=30):
+        super().__init__()
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " phone TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_locks ("
+            " phone TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def lock(self, phone, timeout=30):
+        # Threads queue on the in-process stripe; processes sharing the file
+        # coordinate through a lease row that expires if its owner dies.
+        deadline = time.monotonic() + timeout
+        with super().lock(phone, timeout):
+            owner = uuid.uuid4().hex
+            while not self._try_lease(phone, owner):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for session lock on {phone}")
+                time.sleep(0.002)
+            try:
+                yield
+            finally:
+                self._conn().execute(
+                    "DELETE FROM session_locks WHERE phone = ? AND owner = ?", (phone, owner)
+                )
+
+    def _try_lease(self, phone, owner):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO session_locks (phone, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(phone) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE session_locks.expires_at < ?",
+            (phone, owner, now + self.lease_seconds, now),
+        )
+        return cur.rowcount == 1
+
+    def get_raw(self, phone):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE phone = ?", (phone,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put_raw(self, phone, data):
+        self._conn().execute(
+            "INSERT INTO sessions (phone, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(phone) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (phone, data, int(time.time())),
+        )
+
+    def put_many(self, items):
+        conn = self._conn()
+        now = int(time.time())
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO sessions (phone, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(phone) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                ((phone, encode_session(s), now) for phone, s in items),
+            )
+
+    def delete(self, phone):
+        self._conn().execute("DELETE FROM sessions WHERE phone = ?", (phone,))
+
+    def items(self):
+        # Stream rows instead of materializing every session at once.
+        cursor = self._conn().execute("SELECT phone, data FROM sessions ORDER BY phone")
+        for phone, data in cursor:
+            yield phone, json.loads(data)
+
+    def idle_since(self, cutoff):
+        # updated_at is indexed, so a sweep only touches idle rows.
+        rows = self._conn().execute(
+            "SELECT phone, data FROM sessions WHERE updated_at < ? ORDER BY updated_at", (cutoff,)
+        ).fetchall()
+        for phone, data in rows:
+            yield phone, json.loads(data)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# -------------------- Redis backend --------------------
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis (or anything speaking its protocol), shared by every
+    worker on every host.
+
+    Each session is a string key; a sorted set of phones scored by last
+    write time backs ``count`` and ``idle_since``. Locks are ``SET NX PX``
+    leases that expire if their owner dies.
+    """
+
+    PAGE = 500
+
+    def __init__(self, url, prefix="shopease:", lease_seconds=30):
+        super().__init__()
+        self.client = RespClient(url)
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self._index = prefix + "sessions"
+        self.client.execute("PING")
+
+    def _key(self, phone):
+        return f"{self.prefix}session:{phone}"
+
+    @contextmanager
+    def lock(self, phone, timeout=30):
+        deadline = time.monotonic() + timeout
+        key = f"{self.prefix}lock:{phone}"
+        with super().lock(phone, timeout):
+            owner = uuid.uuid4().hex
+            while self.client.execute("SET", key, owner, "NX", "PX", int(self.lease_seconds * 1000)) is None:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for session lock on {phone}")
+                time.sleep(0.002)
+            try:
+                yield
+            finally:
+                self._release(key, owner)
+
+    def _release(self, key, owner):
+        # WATCH makes the delete a no-op if the lease expired and someone else took it.
+        conn = self.client.connection()
+        conn.execute("WATCH", key)
+        if conn.execute("GET", key) == owner:
+            conn.pipeline(("MULTI",), ("DEL", key), ("EXEC",))
+        else:
+            conn.execute("UNWATCH")
+
+    def _transaction(self, *commands):
+        replies = self.client.pipeline(("MULTI",), *commands, ("EXEC",))
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies[-1]
+
+    def get_raw(self, phone):
+        return self.client.execute("GET", self._key(phone))
+
+    def put_raw(self, phone, data):
+        self._transaction(("SET", self._key(phone), data), ("ZADD", self._index, int(time.time()), phone))
+
+    def put_many(self, items):
+        now = int(time.time())
+        batch = []
+        for phone, session in items:
+            batch += [("SET", self._key(phone), encode_session(session)), ("ZADD", self._index, now, phone)]
+            if len(batch) >= 2 * self.PAGE:
+                self._transaction(*batch)
+                batch = []
+        if batch:
+            self._transaction(*batch)
+
+    def delete(self, phone):
+        self._transaction(("DEL", self._key(phone)), ("ZREM", self._index, phone))
+
+    def _load(self, phones):
+        for start in range(0, len(phones), self.PAGE):
+            chunk = phones[start:start + self.PAGE]
+            for phone, data in zip(chunk, self.client.execute("MGET", *map(self._key, chunk))):
+                if data is not None:
+                    yield phone, json.loads(data)
+
+    def items(self):
+        # Paged by index; sessions written mid-scan may move and be seen twice or not at all.
+        start = 0
+        while True:
+            phones = self.client.execute("ZRANGE", self._index, start, start + self.PAGE - 1)
+            if not phones:
+                return
+            yield from self._load(phones)
+            start += len(phones)
+
+    def idle_since(self, cutoff):
+        phones = self.client.execute("ZRANGEBYSCORE", self._index, "-inf", f"({int(cutoff)}")
+        yield from self._load(phones)
+
+    def count(self):
+        return self.client.execute("ZCARD", self._index)
+
+    def claim(self, key, ttl):
+        """True the first time ``key`` is claimed within ``ttl`` seconds, across all workers."""
+        return self.client.execute("SET", f"{self.prefix}claim:{key}", "1", "NX", "EX", int(ttl)) is not None
+
+    def unclaim(self, key):
+        self.client.execute("DEL", f"{self.prefix}claim:{key}")
+
+    def close(self):
+        self.client.close()
+
+
+# -------------------- Hot-session cache --------------------
+class CachedSessionStore(SessionStore):
+    """Write-through LRU cache of encoded sessions in front of another store.
+
+    Only the ``max_size`` most recently used sessions stay in memory; older
+    ones are evicted and re-read from the backing store on next use. The
+    cache is per process, so use it only when this process is the sole
+    writer for the phones it serves.
+    """
+
+    def __init__(self, backing, max_size=10_000):
+        super().__init__()
+        self.backing = backing
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._cache = OrderedDict()
+        self._mutex = threading.Lock()
+
+    def lock(self, phone, timeout=30):
+        return self.backing.lock(phone, timeout)
+
+    def _remember(self, phone, data):
+        with self._mutex:
+            old = self._cache.pop(phone, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._cache[phone] = data
+            self.bytes += len(data)
+            while len(self._cache) > self.max_size:
+                _, evicted = self._cache.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def _forget(self, phone):
+        with self._mutex:
+            old = self._cache.pop(phone, None)
+            if old is not None:
+                self.bytes -= len(old)
+
+    def get_raw(self, phone):
+        with self._mutex:
+            data = self._cache.get(phone)
+            if data is not None:
+                self._cache.move_to_end(phone)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = self.backing.get_raw(phone)
+        if data is not None:
+            self._remember(phone, data)
+        return data
+
+    def put_raw(self, phone, data):
+        self.backing.put_raw(phone, data)
+        self._remember(phone, data)
+
+    def put_many(self, items):
+        items = list(items)
+        self.backing.put_many(items)
+        for phone, _ in items:
+            self._forget(phone)
+
+    def delete(self, phone):
+        self.backing.delete(phone)
+        self._forget(phone)
+
+    def items(self):
+        return self.backing.items()
+
+    def idle_since(self, cutoff):
+        return self.backing.idle_since(cutoff)
+
+    def count(self):
+        return self.backing.count()
+
+    def close(self):
+        self.backing.close()
+
+    def stats(self):
+        with self._mutex:
+            size = len(self._cache)
+            return {
+                "cached": size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self.bytes,
+                "bytes_per_session": round(self.bytes / size, 1) if size else 0,
+            }
+
+
+def open_session_store(url):
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    if url.startswith("redis://"):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unsupported session store URL: {url}")
+
+
+# -------------------- One-time migration --------------------
+def migrate_json_sessions(json_path, store):
+    """Import a legacy user_data.json into ``store`` and rename it out of the way."""
+    # Several workers may start at once; renaming the file claims it for one of them.
+    claimed = f"{json_path}.{os.getpid()}.migrating"
+    try:
+        os.rename(json_path, claimed)
+    except FileNotFoundError:
+        return 0
+    try:
+        with open(claimed, "r") as f:
+            content = f.read().strip()
+        data = json.loads(content) if content else {}
+    except json.JSONDecodeError:
+        # Keep the broken file around for inspection instead of wiping it.
+        os.rename(claimed, json_path)
+        print(f"⚠️ {json_path} is corrupted, skipping migration.")
+        return 0
+    store.put_many(data.items())
+    os.replace(claimed, json_path + ".migrated")
+    print(f"Migrated {len(data)} sessions from {json_path}.")
+    return len(data)
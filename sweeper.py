@@ -0,0 +1,114 @@
+# sweeper.py
+import json
+import threading
+import time
+
+from db import connect
+
+
+class CartArchive:
+    """Append-only SQLite log of carts left behind in expired sessions."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS abandoned_carts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " phone TEXT NOT NULL,"
+            " cart TEXT NOT NULL,"
+            " stage TEXT,"
+            " last_seen INTEGER,"
+            " archived_at INTEGER NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def add(self, phone, session):
+        self._conn().execute(
+            "INSERT INTO abandoned_carts (phone, cart, stage, last_seen, archived_at) VALUES (?, ?, ?, ?, ?)",
+            (phone, json.dumps(session.get("cart", {})), session.get("stage"),
+             session.get("last_seen", 0), int(time.time())),
+        )
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM abandoned_carts").fetchone()[0]
+
+
+class SessionSweeper:
+    """Expires sessions idle for ``idle_seconds``, archiving non-empty carts.
+
+    Runs every ``interval`` seconds on a daemon thread. ``on_expire``
+    callables get the phone of each expired session, still under its lock
+    (e.g. inventory.release_all); ``tasks`` are extra housekeeping
+    callables run after each sweep (e.g. dedup.purge).
+    """
+
+    def __init__(self, store, archive, idle_seconds, interval=300, tasks=(), on_expire=()):
+        self.store = store
+        self.archive = archive
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.tasks = list(tasks)
+        self.on_expire = list(on_expire)
+        self.runs = 0
+        self.expired = 0
+        self.archived = 0
+        self.last_run_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        started = time.monotonic()
+        cutoff = int(time.time()) - self.idle_seconds
+        expired = archived = 0
+        for phone, _ in self.store.idle_since(cutoff):
+            with self.store.lock(phone):
+                # Re-read under the lock: the user may have come back meanwhile.
+                session = self.store.get(phone)
+                if session is None or session.get("last_seen", 0) >= cutoff:
+                    continue
+                if session.get("cart"):
+                    self.archive.add(phone, session)
+                    archived += 1
+                self.store.delete(phone)
+                for callback in self.on_expire:
+                    callback(phone)
+                expired += 1
+        for task in self.tasks:
+            task()
+        self.runs += 1
+        self.expired += expired
+        self.archived += archived
+        self.last_run_seconds = time.monotonic() - started
+        if expired:
+            print(f"Session sweep: expired {expired} sessions, archived {archived} carts.")
+        return expired
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "expired": self.expired,
+            "archived": self.archived,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+        }
@@ -0,0 +1,5 @@
+# wsgi.py
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# Each worker imports app.py after the fork, so stores, sender threads and
+# the sweeper are per process, while sessions live in the shared store.
+from app import app